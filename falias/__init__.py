@@ -5,6 +5,9 @@ This package contains these modules:
 falias.sql
     Global sql wrapper for universal using depend on driver.
 
+falias.asyncsql
+    Asyncio interface for falias.sql.
+
 falias.mysql
     Wrapper around MySQL-python connection.s
 
@@ -15,6 +18,15 @@ falias.security
     Security library is based on smartsalt function which salt text depend
     on input text.
 
+falias.cache
+    Query result cache with TTL and table based invalidation.
+
+falias.pool
+    Thread-safe pool of connections.
+
+falias.stats
+    Query timing, counting and slow query instrumentation.
+
 falias.util
     Support library for auto convert or check types.
 
@@ -25,7 +37,8 @@ falias.parser
     ConfigParser wrapper for type conversation
 """
 
-__all__ = ["mysql", "sqlite", "sql", "security", "util", "smtp", "parser"]
+__all__ = ["mysql", "sqlite", "sql", "asyncsql", "cache", "pool", "stats",
+           "security", "util", "smtp", "parser"]
 
 __date__ = "20 Apr 2024"
 __version__ = "0.2.2dev0"
@@ -0,0 +1,235 @@
+"""Asyncio interface for falias.sql.
+
+Drivers are blocking, so each AsyncSql worker has its own thread and its own
+Sql object with connection. Transaction reserves one worker, and all its
+calls are done in worker's thread. So connection is used only in one thread,
+which is required by sqlite3.
+
+>>> from falias.asyncsql import AsyncSql
+>>> db = AsyncSql('sqlite:/var/lib/db.sqlite', workers=4)
+>>> async with db.transaction() as c:
+...     await c.execute("SELECT %d", 1)
+...     row = await c.fetchone()
+>>> await db.close()
+
+In-memory SQLite database is not shared between workers, so use only one
+worker for it.
+
+Each transaction holds its worker until it is done, so nested transaction
+in the same task needs another free worker. When all workers are held by
+the task yet, RuntimeError is raised instead of waiting forever.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import partial
+
+from falias.sql import Sql
+
+# AsyncSql objects, which workers are held by current task
+held_workers = ContextVar("held_workers", default=())
+
+
+class Worker:
+    """Thread with own Sql object."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="falias")
+        self.sql = None
+
+    async def run(self, func, *args, **kwargs):
+        """Call function in worker's thread and return its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(func, *args, **kwargs))
+
+    async def close(self):
+        """Close Sql object and shutdown worker's thread."""
+        if self.sql is not None:
+            await self.run(self.sql.close)
+        self.executor.shutdown()
+
+
+class AsyncCursor:
+    """Awaitable wrapper around driver cursor."""
+
+    def __init__(self, worker, cursor):
+        self.worker = worker
+        self.cursor = cursor
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    async def execute(self, query, args=()):
+        """Execute query, see driver cursor's execute method."""
+        await self.worker.run(self.cursor.execute, query, args)
+        return self
+
+    async def executemany(self, query, seq_of_args):
+        """Execute query for each arguments in sequence."""
+        await self.worker.run(self.cursor.executemany, query,
+                              list(seq_of_args))
+        return self
+
+    async def fetchone(self):
+        """Fetch a single row, None when no more rows are available."""
+        return await self.worker.run(self.cursor.fetchone)
+
+    async def fetchmany(self, size=None):
+        """Fetch up to size rows, cursor.arraysize by default."""
+        return await self.worker.run(
+            self.cursor.fetchmany, size or self.cursor.arraysize)
+
+    async def fetchall(self):
+        """Fetch all available rows."""
+        return await self.worker.run(self.cursor.fetchall)
+
+    async def close(self):
+        """Close cursor."""
+        await self.worker.run(self.cursor.close)
+
+
+class AsyncTransaction:
+    """Transaction which reserves one worker, until it is done."""
+
+    def __init__(self, db, **kwargs):
+        self.db = db
+        self.kwargs = kwargs
+        self.worker = None
+        self.transaction = None
+        self.cursors = []
+
+    async def begin(self):
+        """Reserve worker and create driver transaction in it."""
+        held = held_workers.get()
+        if held.count(self.db) >= self.db.workers:
+            raise RuntimeError("All workers are held by this task, nested "
+                               "transaction would wait forever")
+        self.worker = await self.db.get_worker()
+        held_workers.set(held + (self.db,))
+        try:
+            self.transaction = await self.worker.run(
+                self.worker.sql.transaction, **self.kwargs)
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    async def __aenter__(self):
+        await self.begin()
+        return await self.cursor(self.transaction.ctx_cursor)
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.commit()
+        else:
+            await self.rollback()
+
+    async def cursor(self, cursorclass=None):
+        """Create and return AsyncCursor."""
+        if cursorclass is None:
+            cursor = await self.worker.run(self.transaction.cursor)
+        else:
+            cursor = await self.worker.run(self.transaction.cursor,
+                                           cursorclass)
+        cursor = AsyncCursor(self.worker, cursor)
+        self.cursors.append(cursor)
+        return cursor
+
+    async def commit(self):
+        """Commit transaction and release worker."""
+        try:
+            return await self.worker.run(self._done, "commit")
+        finally:
+            self._release()
+
+    async def rollback(self):
+        """Rollback transaction and release worker."""
+        try:
+            return await self.worker.run(self._done, "rollback")
+        finally:
+            self._release()
+
+    def _done(self, method):
+        """Close cursors and call commit or rollback in worker's thread.
+
+        Driver cursors are released here, so they are destroyed in worker's
+        thread too."""
+        while self.cursors:
+            cursor = self.cursors.pop()
+            driver_cursor, cursor.cursor = cursor.cursor, None
+            driver_cursor.close()
+            del driver_cursor
+        return getattr(self.transaction, method)()
+
+    def _release(self):
+        """Give worker back to AsyncSql object."""
+        if self.worker is not None:
+            self.db.put_worker(self.worker)
+            self.worker = None
+            held = list(held_workers.get())
+            if self.db in held:
+                held.remove(self.db)
+                held_workers.set(tuple(held))
+
+
+class AsyncSql:
+    """Asyncio SQL wrapper with the same Data Source Name as falias.sql.Sql.
+
+    workers - count of threads, which means count of connections
+    """
+
+    def __init__(self, dsn="", workers=1, **kwargs):
+        self.sql = Sql(dsn, **kwargs)       # check Data Source Name
+        self.dsn = dsn
+        self.kwargs = kwargs
+        self.workers = workers
+        self._all = []
+        self._idle = None
+
+    async def get_worker(self):
+        """Return idle worker, or create new one if limit allows it."""
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        if self._idle.empty() and len(self._all) < self.workers:
+            worker = Worker()
+            self._all.append(worker)
+            try:
+                worker.sql = await worker.run(Sql, self.dsn, **self.kwargs)
+            except BaseException:
+                self._all.remove(worker)
+                worker.executor.shutdown(wait=False)
+                raise
+            return worker
+        return await self._idle.get()
+
+    def put_worker(self, worker):
+        """Return worker back."""
+        self._idle.put_nowait(worker)
+
+    def transaction(self, logger=None, cursor=None, **kwargs):
+        """Return AsyncTransaction, which is used with async with.
+
+        Keyword arguments like readonly, bind or in_limit are passed to
+        Sql.transaction method in worker's thread."""
+        return AsyncTransaction(self, logger=logger, cursor=cursor, **kwargs)
+
+    async def close(self):
+        """Close all workers."""
+        workers, self._all = self._all, []
+        self._idle = None
+        for worker in workers:
+            await worker.close()
+
+    def __str__(self):
+        return str(self.sql)
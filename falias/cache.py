@@ -0,0 +1,122 @@
+"""Query result cache with TTL and table based invalidation.
+
+Cache is used by falias.sql.Sql object, when cache_size is set. Rows are
+stored by cursor's cached method, and they are invalidated, when any write
+query in the same process touches some table, from which they was read.
+Tables are detected by simple statement parse, so unknown write statements
+clear the whole cache. Writes from other processes are not detected, so
+ttl must be set with respect to them.
+
+>>> db = Sql('sqlite:/var/lib/db.sqlite', cache_size=256, cache_ttl=60)
+>>> with db.transaction() as c:
+...     rows = c.cached("SELECT * FROM config WHERE name = %s", 'theme')
+"""
+
+import re
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+# read only statements
+re_read = re.compile(r"\s*(?:\(\s*)*(SELECT|WITH|SHOW|EXPLAIN|DESCRIBE)\b",
+                     re.I)
+
+# tables in write statements
+re_write = re.compile(r"""^\s*(?:
+        (?:INSERT|REPLACE)(?:\s+OR\s+\w+)?
+            (?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE))*
+            (?:\s+INTO)?
+      | UPDATE(?:\s+OR\s+\w+)?(?:\s+(?:LOW_PRIORITY|IGNORE))*
+      | DELETE(?:\s+(?:LOW_PRIORITY|QUICK|IGNORE))*\s+FROM
+      | TRUNCATE(?:\s+TABLE)?
+      | (?:DROP|ALTER)\s+TABLE(?:\s+IF\s+EXISTS)?
+    )\s+([\w\.`"\[\]]+)""", re.I | re.X)
+
+# table list after FROM or JOIN in read statements
+re_from = re.compile(r"""\b(?:FROM|JOIN)\s+([^;()]*?)
+                         (?=\b(?:WHERE|GROUP|ORDER|LIMIT|HAVING|UNION|JOIN|ON
+                              |USING|WINDOW)\b|[;()]|$)""", re.I | re.X | re.S)
+
+
+def table_name(name):
+    """Return normalized table name without quotes and database."""
+    return name.strip("`\"[]").split(".")[-1].strip("`\"[]").lower()
+
+
+def read_tables(sql):
+    """Return set of tables, from which query reads."""
+    tables = set()
+    for clause in re_from.findall(sql):
+        for item in clause.split(","):
+            words = item.split()
+            if words:
+                tables.add(table_name(words[0]))
+    return tables
+
+
+def write_tables(sql):
+    """Return None for read only query, or set of written tables.
+
+    Empty set means, that tables are not known."""
+    if re_read.match(sql):
+        return None
+    match = re_write.match(sql)
+    if match:
+        return {table_name(match.group(1))}
+    return set()
+
+
+class QueryCache:
+    """Thread-safe LRU cache of fetched rows.
+
+    size - max count of stored results
+    ttl - default time to live of result in seconds
+    """
+
+    def __init__(self, size=128, ttl=60):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()      # key: (expire, tables, rows)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Return rows or None, if key is not in cache or it expires."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[2]
+
+    def put(self, key, rows, tables, ttl=None):
+        """Store rows read from tables."""
+        expire = monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expire, frozenset(tables), rows)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, tables):
+        """Remove results read from tables, or all for empty tables."""
+        with self._lock:
+            if not tables:
+                self._data.clear()
+                return
+            for key, item in list(self._data.items()):
+                if item[1] & tables or not item[1]:
+                    del self._data[key]
+
+    def clear(self):
+        """Remove all results."""
+        with self._lock:
+            self._data.clear()
@@ -16,11 +16,62 @@ ERROR:root:SQL: calling rollback()
 """
 
 import re
+import warnings
+from contextlib import suppress
+from functools import partial
+from itertools import count
+from threading import Lock
+from time import monotonic, perf_counter
+from traceback import format_stack
+from urllib.parse import parse_qsl
+from weakref import WeakSet
 
 from pymysql import cursors
 from pymysql.connections import Connection
+from pymysql.err import InterfaceError, MySQLError, OperationalError
 
-from .util import islistable, isnumber
+from .cache import read_tables, write_tables
+from .pool import Pool
+from .util import (Query, RawSql, bind_template, islistable, isnumber,
+                   log_sql, plain_template, row_class, sql_logger)
+
+# lost connection errors (server has gone away, lost connection)
+RECONNECT_ERRORS = (2006, 2013)
+
+# errors after which transaction could be run again (deadlock, lock wait
+# timeout and lost connection)
+TRANSIENT_ERRORS = (1213, 1205, *RECONNECT_ERRORS)
+
+# INSERT or REPLACE query, which values could be folded to multi-row query
+re_insert_values = re.compile(r"""\s*((?:INSERT|REPLACE)\b.+?\bVALUES?\s*)
+                                  (\(.+?\))
+                                  (\s*(?:ON\s+DUPLICATE\b.*)?);?\s*\Z
+                               """, re.I | re.S | re.X)
+
+
+def null_tosql(cursor, arg, charset):
+    """Convert None to sql."""
+    return "NULL"
+
+
+def number_tosql(cursor, arg, charset):
+    """Numbers (and bool) are formatted by query template."""
+    return arg
+
+
+def str_tosql(cursor, arg, charset):
+    """Convert string to escaped sql string."""
+    return cursor.connection.escape(arg)    # quoted by driver
+
+
+def raw_tosql(cursor, arg, charset):
+    """RawSql is put into query as is."""
+    return arg
+
+
+def listable_tosql(cursor, arg, charset):
+    """Convert list, tuple or set to sql list."""
+    return "(" + ",".join(str(cursor.tosql(a, charset)) for a in arg) + ")"
 
 
 class BaseCursor(cursors.Cursor):
@@ -28,28 +79,72 @@ class BaseCursor(cursors.Cursor):
     BaseCursor extendet with tosql method, which covert types
     automatics to sql.
 
-    logger - logging function of sql queries
+    logger - logging.Logger or logging function of sql queries, see
+             falias.util.log_sql
+    bind - when it is True, arguments are not converted to sql by tosql, but
+           passed to driver, which escapes them; query template is rewritten
+           only once and it is cached; queries with formatting placeholders
+           like %.2f or %x are rendered as without bind
+    max_stmt_length - max length of multi-row INSERT query created by
+                      executemany method (inherited from pymysql)
+    converters - converter function for each argument type, which is looked
+                 up only once; only built-in types are cached
+    in_limit - listable arguments longer than in_limit are loaded to
+               temporary tables falias_in_<position>_<type> and they are
+               replaced by subquery from them
+    cache - falias.cache.QueryCache, write queries invalidate cached results
+            and cached method could be used
+    instrument - falias.stats.Instrument, which hooks are called for each
+                 query
     """
+    bind = False
+    converters = {type(None): null_tosql, int: number_tosql,
+                  float: number_tosql, bool: number_tosql, str: str_tosql,
+                  RawSql: raw_tosql, list: listable_tosql,
+                  tuple: listable_tosql, set: listable_tosql}
+    in_limit = 0
+    cache = None
+    instrument = None
+    transaction = None
 
     def __init__(self, connection):
         super().__init__(connection)
         self.logger = None
 
-    def tosql(self, arg, charset):
-        """ Automatics convert arguments to sql types """
-        if arg is None:                                     # null
-            arg = "NULL"
-        elif isnumber(arg):                                 # float, int, long
-            pass
-        elif isinstance(arg, str):  # str
-            arg = "'%s'" % self.connection.escape_string(arg)
-        elif isinstance(arg, bool):                         # bool
-            arg = 1 if arg else 0
-        elif islistable(arg):                               # list, tuple, set
-            arg = "(" + ",".join(self.tosql(a, charset) for a in arg) + ")"
+    def converter(self, cls):
+        """ Return and cache converter function for type of argument """
+        if issubclass(cls, (float, int)):                   # float, int, long
+            conv = number_tosql
+        elif issubclass(cls, str):                          # str
+            conv = str_tosql
+        elif issubclass(cls, (list, tuple, set)):           # list, tuple, set
+            conv = listable_tosql
         else:                                               #
             msg = "Unsuported type"
             raise TypeError(msg)
+        if cls.__module__ == "builtins":
+            self.converters[cls] = conv
+        return conv
+
+    def tosql(self, arg, charset):
+        """ Automatics convert arguments to sql types """
+        conv = self.converters.get(type(arg)) or self.converter(type(arg))
+        return conv(self, arg, charset)
+
+    def prepare(self, query):
+        """Return compiled query template, which could be used for execute.
+
+        Query placeholders are parsed only once, which helps in bind mode."""
+        return Query(query)
+
+    def tobind(self, arg, kind):
+        """Prepare argument for driver binding like tosql do for %-format."""
+        if kind in "di" and isinstance(arg, float):
+            return int(arg)
+        if kind == "f" and isnumber(arg):
+            return float(arg)
+        if isinstance(arg, set):
+            return tuple(arg)
         return arg
 
     def execute(self, query, args=()):
@@ -57,22 +152,212 @@ class BaseCursor(cursors.Cursor):
         Execute method use tosql method fo conversation and self.logger
         to log query if logger was set.
         """
+        if self.cache is not None:
+            self.uncache(query)
+
+        if self.in_limit and isinstance(args, (list, tuple)):
+            args = self.in_tables(args)
+
+        if self.bind and plain_template(query):
+            if not isinstance(args, (list, tuple)):
+                args = (args,)
+            sql, kinds = bind_template(query, "%s")
+            if any(isinstance(arg, RawSql) for arg in args):
+                # raw sql must be in query, not escaped by driver
+                sql = sql.replace("%%", "%%%%") % tuple(
+                    arg if isinstance(arg, RawSql) else "%s" for arg in args)
+                kinds = [kind for arg, kind in zip(args, kinds)
+                         if not isinstance(arg, RawSql)]
+                args = [arg for arg in args if not isinstance(arg, RawSql)]
+            params = tuple(self.tobind(arg, kind)
+                           for arg, kind in zip(args, kinds))
+            if self.logger is not None:
+                log_sql(self.logger, "SQL: \33[0;32m%s\33[0m %s", sql, params)
+            return self.run(query, sql, args, params)
+
+        sql = self.render(query, args)
+        if self.logger is not None:
+            log_sql(self.logger, "SQL: \33[0;32m%s\33[0m", sql)
+        return self.run(query, sql, args)
+
+    def run(self, query, sql, args, params=None):
+        """Execute final sql by pymysql, with instrument hooks if set."""
+        if self.instrument is None:
+            return self.execute_first(sql, params)
+        self.instrument.before_execute(self, query, sql, args, params)
+        start = perf_counter()
+        try:
+            retval = self.execute_first(sql, params)
+        except Exception as err:
+            self.instrument.after_execute(self, query, sql, args, params,
+                                          perf_counter() - start, -1, err)
+            raise
+        self.instrument.after_execute(self, query, sql, args, params,
+                                      perf_counter() - start, retval, None)
+        return retval
+
+    def execute_first(self, sql, params=None):
+        """Execute sql by pymysql.
+
+        When first statement of transaction fails on lost connection, there
+        is no transaction state on server yet, so connection is reconnected
+        and statement is executed again."""
+        transaction = self.transaction
+        if transaction is None or transaction.executed:
+            return cursors.Cursor.execute(self, sql, params)
+        transaction.executed = True
+        try:
+            return cursors.Cursor.execute(self, sql, params)
+        except (OperationalError, InterfaceError) as err:
+            # closed connection raises InterfaceError(0, "")
+            if err.args[0] not in RECONNECT_ERRORS and self.connection.open:
+                raise
+            sql_logger.warning("SQL: reconnecting after error %s", err)
+            self.connection.ping(True)
+            return cursors.Cursor.execute(self, sql, params)
+
+    def render(self, query, args=()):
+        """Return query with arguments converted by tosql."""
         # funcking conversion to db charset
         db = self._get_db()
         charset = db.character_set_name()
-
+        return query % self.args_tosql(args, charset)
+
+    def uncache(self, query):
+        """Invalidate cached results of tables, which query writes to."""
+        tables = write_tables(query)
+        if tables is not None:
+            self.cache.invalidate(tables)
+            if self.transaction is not None:
+                self.transaction.written.append(tables)
+
+    def cached(self, query, args=(), ttl=None):
+        """Return all rows of query from cache.
+
+        When result is not in cache, query is executed and fetched rows are
+        stored. Without cache, it is the same as execute and fetchall.
+        Cursor attributes like description are not set from cache.
+
+        After write in the same transaction, query is executed directly,
+        because uncommitted rows must not be visible in other transactions
+        by cache."""
+        if self.cache is None or (self.transaction is not None
+                                  and self.transaction.written):
+            self.execute(query, args)
+            return self.fetchall()
+
+        sql = self.render(query, args)
+        key = (self.__class__, sql)
+        rows = self.cache.get(key)
+        if rows is None:
+            if self.logger is not None:
+                log_sql(self.logger, "SQL: \33[0;32m%s\33[0m", sql)
+            self.run(sql, sql, ())
+            rows = self.fetchall()
+            self.cache.put(key, rows, read_tables(sql), ttl)
+        elif self.logger is not None:
+            log_sql(self.logger, "SQL: \33[0;32m%s\33[0m (cached)", sql)
+        return list(rows)
+
+    def in_tables(self, args):
+        """Load listable arguments longer than in_limit to temporary tables.
+
+        Returns arguments, where these lists are replaced by subqueries.
+        Temporary tables are not shared, so writes to them do not invalidate
+        query cache."""
+        retval = []
+        cache, self.cache = self.cache, None
+        try:
+            for i, arg in enumerate(args):
+                if islistable(arg) and len(arg) > self.in_limit:
+                    if all(isinstance(it, int) for it in arg):
+                        kind, column = "int", "BIGINT, KEY (value)"
+                    elif all(isinstance(it, (int, float)) for it in arg):
+                        kind, column = "float", "DOUBLE, KEY (value)"
+                    else:
+                        kind, column = "str", "TEXT"
+                    table = "falias_in_%d_%s" % (i, kind)
+                    self.execute("CREATE TEMPORARY TABLE IF NOT EXISTS %s "
+                                 "(value %s)" % (table, column))
+                    self.execute("DELETE FROM %s" % table)
+                    self.executemany("INSERT INTO %s (value) VALUES (%%s)"
+                                     % table, arg)
+                    arg = RawSql("(SELECT value FROM %s)" % table)
+                retval.append(arg)
+        finally:
+            self.cache = cache
+        return tuple(retval)
+
+    def args_tosql(self, args, charset):
+        """Convert list or tuple of arguments, or one argument with tosql."""
         if isinstance(args, (list, tuple)):
-            _args = []
-            for arg in args:
-                _args.append(self.tosql(arg, charset))
-            args = tuple(_args)
+            converters = self.converters
+            return tuple((converters.get(type(arg))
+                          or self.converter(type(arg)))(self, arg, charset)
+                         for arg in args)
+        return self.tosql(args, charset)
+
+    def executemany(self, query, args):
+        """Execute query for each arguments in args sequence.
+
+        INSERT and REPLACE queries are folded to multi-row queries, which are
+        not longer then max_stmt_length. Other queries are called one by one.
+        Arguments are converted like in execute method, or escaped by driver
+        in bind mode. Returns count of affected rows.
+        """
+        if self.cache is not None:
+            self.uncache(query)
+        match = re_insert_values.match(query)
+        if not match:
+            self.rowcount = sum(self.execute(query, row) for row in args)
+            return self.rowcount
+
+        prefix, values, postfix = match.groups()
+        if self.bind and plain_template(values):
+            values, kinds = bind_template(values, "%s")
+
+            def render(row):
+                if not isinstance(row, (list, tuple)):
+                    row = (row,)
+                return self.mogrify(values, tuple(
+                    self.tobind(arg, kind) for arg, kind in zip(row, kinds)))
         else:
-            args = self.tosql(args, charset)
-
-        sql = query % args
+            charset = self._get_db().character_set_name()
+
+            def render(row):
+                return values % self.args_tosql(row, charset)
+
+        rowcount = 0
+        rows, length = [], len(prefix) + len(postfix)
+        for row in args:
+            value = render(row)
+            if rows and length + len(value) + 1 > self.max_stmt_length:
+                rowcount += self.execute_values(query, prefix, rows, postfix)
+                rows, length = [], len(prefix) + len(postfix)
+            rows.append(value)
+            length += len(value) + 1
+        if rows:
+            rowcount += self.execute_values(query, prefix, rows, postfix)
+        self.rowcount = rowcount
+        return rowcount
+
+    def execute_values(self, query, prefix, rows, postfix):
+        """Execute multi-row query created from rendered rows."""
+        sql = prefix + ",".join(rows) + postfix
         if self.logger is not None:
-            self.logger("SQL: \33[0;32m%s\33[0m" % sql)
-        return super().execute(sql)
+            log_sql(self.logger, "SQL: \33[0;32m%s\33[0m", sql)
+        return self.run(query, sql, None)
+
+    def chunks(self, size=None):
+        """Generate lists of rows by fetchmany, until result is exhausted.
+
+        With SSCursor or SSDictCursor, only one chunk is in memory."""
+        size = size or self.arraysize
+        while True:
+            rows = self.fetchmany(size)
+            if not rows:
+                return
+            yield rows
 
     def unlock_tables(self):
         """Call unlock tables."""
@@ -91,16 +376,96 @@ class DictCursor(BaseCursor, cursors.DictCursor):
         cursors.DictCursor.__init__(self, connection)
 
 
+class RowCursorMixin:
+    """ Mixin which converts rows to falias.util.Row objects """
+    def _do_get_result(self):
+        super()._do_get_result()
+        if self.description:
+            self._row_class = row_class(
+                tuple(it[0] for it in self.description))
+            if self._rows:
+                self._rows = [self._conv_row(row) for row in self._rows]
+
+    def _conv_row(self, row):
+        if row is None:
+            return None
+        return self._row_class(self, row)
+
+
+class RowCursor(RowCursorMixin, BaseCursor, cursors.Cursor):
+    """ Cursor which returns rows like sqlite3.Row, see falias.util.Row """
+    def __init__(self, connection):
+        cursors.Cursor.__init__(self, connection)
+
+
+class SSCursor(BaseCursor, cursors.SSCursor):
+    """ Unbuffered cursor, rows are read from server on demand """
+    def __init__(self, connection):
+        cursors.SSCursor.__init__(self, connection)
+
+
+class SSDictCursor(BaseCursor, cursors.SSDictCursor):
+    """ Unbuffered dictionary cursor """
+    def __init__(self, connection):
+        cursors.SSDictCursor.__init__(self, connection)
+
+
+class SSRowCursor(RowCursorMixin, BaseCursor, cursors.SSCursor):
+    """ Unbuffered cursor which returns falias.util.Row objects """
+    def __init__(self, connection):
+        cursors.SSCursor.__init__(self, connection)
+
+
 class Transaction():
     """Transaction connection class with automatic rollback in destructor."""
 
-    def __init__(self, connection, logger=None, ctx_cursor=Cursor):
-        """ logger is log handler with one text parametr """
+    def __init__(self, connection, logger=None, ctx_cursor=Cursor,
+                 release=None, bind=False, in_limit=0, cache=None,
+                 instrument=None, ping_interval=0,
+                 leak_stack=False, readonly=False):
+        """ logger is logging.Logger, falias.sql logger by default, or log
+        handler with one text parametr. Queries are logged as debug messages,
+        which are formatted only if they are emitted.
+
+        release is function, which gets back connection, when transaction
+        is done. It is used by connection pool. Closed connection is passed
+        with discard=True keyword argument. bind, in_limit, cache and
+        instrument are set to cursors. Tables written in transaction are
+        invalidated in cache again on commit or rollback.
+
+        Transaction should be done by commit, rollback or close. When it is
+        collected by garbage collector still open, ResourceWarning is
+        emitted, with stack where it was created if leak_stack is True.
+
+        readonly means, that transaction runs on read only replica.
+
+        Connection is pinged (and reconnected) only when it was idle for
+        ping_interval seconds or more; -1 disables pinging. Connection
+        closed by driver after error is reconnected always. Lost connection
+        is reconnected on the first statement too.
+
+        replica is set to Replica object, when transaction runs on replica.
+        """
         self.conn = connection
-        self.conn.ping(True)
+        used = getattr(connection, "falias_used", None)
+        if not connection.open or (
+                used is not None and -1 < ping_interval <= monotonic() - used):
+            self.conn.ping(True)
+        self.executed = False
+        self.done = False
         self.commited = False
-        self.logger = logger
+        self.logger = sql_logger if logger is None else logger
         self.ctx_cursor = ctx_cursor
+        self.release = release
+        self.bind = bind
+        self.in_limit = in_limit
+        self.cache = cache
+        self.written = []
+        self.instrument = instrument
+        self.cursors = WeakSet()
+        self.stack = format_stack()[:-1] if leak_stack else None
+        self.readonly = readonly
+        self.replica = None
 
     def __enter__(self):
         return self.cursor(self.ctx_cursor)
@@ -114,30 +479,211 @@ class Transaction():
     def cursor(self, cursorclass=Cursor):
         """Create and return cursor.
 
-        Cursor could be Cursor (default) or DictCursor."""
+        Cursor could be Cursor (default), DictCursor, RowCursor, or
+        unbuffered SSCursor, SSDictCursor and SSRowCursor for big result
+        sets."""
         c = self.conn.cursor(cursorclass)
         c.logger = self.logger
+        c.bind = self.bind
+        c.in_limit = self.in_limit
+        c.cache = self.cache
+        c.instrument = self.instrument
+        self.cursors.add(c)
         c.transaction = self
         return c
 
     def commit(self):
         """Commit transaction and log it when logger was set."""
         self.commited = True
+        self.done = True
         if self.logger is not None:
-            self.logger("SQL: \33[3;34mcalling commit()\33[0m")
-        return self.conn.commit()
+            log_sql(self.logger, "SQL: \33[3;34mcalling commit()\33[0m")
+        start = perf_counter()
+        try:
+            retval = self.conn.commit()
+            if self.instrument is not None:
+                self.instrument.after_commit(self, perf_counter() - start)
+        except Exception:
+            # failed transaction must not stay open on released connection
+            with suppress(Exception):
+                self.conn.rollback()
+            raise
+        finally:
+            self._uncache()
+            self._release()
+        return retval
 
     def rollback(self):
         """Rollback transaction and log it when logger was set."""
         self.commited = False
+        self.done = True
+        if self.logger is not None:
+            log_sql(self.logger, "SQL: \33[3;33mcalling rollback()\33[0m")
+        start = perf_counter()
+        retval = None
+        try:
+            retval = self.conn.rollback()
+            if self.instrument is not None:
+                self.instrument.after_rollback(self, perf_counter() - start)
+        except MySQLError:
+            # server rolls back transaction of lost connection itself, so
+            # original error is not replaced by this one
+            if self.conn.open:
+                raise
+        finally:
+            self._uncache()
+            self._release()
+        return retval
+
+    def savepoint(self, name):
+        """Create savepoint for nested transaction."""
+        self.query("SAVEPOINT %s" % name)
+
+    def release_savepoint(self, name):
+        """Release savepoint, its changes stay in transaction."""
+        self.query("RELEASE SAVEPOINT %s" % name)
+
+    def rollback_savepoint(self, name):
+        """Rollback changes after savepoint and release it."""
+        self.query("ROLLBACK TO SAVEPOINT %s" % name)
+        self.query("RELEASE SAVEPOINT %s" % name)
+
+    def query(self, sql):
+        """Execute transaction control statement."""
         if self.logger is not None:
-            self.logger("SQL: \33[3;33mcalling rollback()\33[0m")
-        return self.conn.rollback()
+            log_sql(self.logger, "SQL: \33[3;34m%s\33[0m", sql)
+        self.conn.query(sql)
+
+    def _uncache(self):
+        """Invalidate tables written in transaction."""
+        written, self.written = self.written, []
+        for tables in written:
+            self.cache.invalidate(tables)
+
+    def _release(self):
+        """Give back the connection, if release function was set.
+
+        Connection closed by driver is discarded."""
+        self.conn.falias_used = monotonic()
+        if self.release is not None:
+            release, self.release = self.release, None
+            if self.conn.open:
+                release(self.conn)
+            else:
+                release(self.conn, discard=True)
+            self.conn = None
+
+    def close(self):
+        """Close all cursors and rollback transaction, if it was not done."""
+        # set could contain dead references in garbage collector cycle
+        for c in list(self.cursors):
+            c.close()
+        self.cursors.clear()
+        if not self.done and self.conn is not None:
+            self.rollback()
 
     def __del__(self):
-        """If transaction was not committed, call rollback."""
-        if not self.commited:
-            self.rollback()
+        """If transaction was not done, warn about it and close it."""
+        if not self.done and self.conn is not None:
+            msg = "Transaction was not done"
+            if self.stack:
+                msg += ", it was created at:\n" + "".join(self.stack)
+            warnings.warn(msg, ResourceWarning, source=self)
+            self.close()
+
+
+class Replica:
+    """Read only replica server.
+
+    Replica has own connection, or own pool with the same limits as primary
+    pool in pool mode. When replica fails, it is marked down and it is
+    skipped by read only transactions for retry seconds.
+    """
+
+    def __init__(self, kwargs, retry=30):
+        self.kwargs = kwargs
+        self.retry = retry
+        self.connection = None
+        self.pool = None
+        self.active = 0             # count of running transactions
+        self.down_until = 0.0
+        self._lock = Lock()
+
+    def __str__(self):
+        return "%s:%d" % (self.kwargs["host"], self.kwargs["port"])
+
+    @property
+    def healthy(self):
+        """True if replica is not marked down."""
+        return self.down_until <= monotonic()
+
+    def mark_down(self, retry=None):
+        """Take replica out for retry seconds and close its connections."""
+        self.down_until = monotonic() + (
+            self.retry if retry is None else retry)
+        sql_logger.warning("SQL: replica %s is marked down", self)
+        self.close()
+
+    def mark_up(self):
+        """Return replica back."""
+        self.down_until = 0.0
+
+    def check(self):
+        """Check replica by new connection, mark it up or down.
+
+        Returns True, if replica is healthy."""
+        try:
+            Connection(**self.kwargs).close()
+        except OperationalError:
+            self.mark_down()
+            return False
+        self.mark_up()
+        return True
+
+    def transaction(self, sql, **kwargs):
+        """Create and return Transaction on replica connection."""
+        if sql.pool is None:
+            if self.connection is None:
+                self.connection = Connection(**self.kwargs)
+            conn = self.connection
+        else:
+            with self._lock:
+                if self.pool is None:
+                    self.pool = Pool(
+                        partial(Connection, **self.kwargs),
+                        sql.pool.pool_size, sql.pool.max_overflow,
+                        sql.pool.timeout, sql.pool.recycle)
+            conn = self.pool.get()
+        with self._lock:
+            self.active += 1
+        try:
+            retval = Transaction(conn, release=self.release, **kwargs)
+        except Exception:
+            self.release(conn, discard=True)
+            raise
+        retval.replica = self
+        return retval
+
+    def release(self, conn, discard=False):
+        """Give back the connection of done transaction."""
+        with self._lock:
+            self.active -= 1
+        if self.pool is not None:
+            if discard:
+                self.pool.discard(conn)
+            else:
+                self.pool.put(conn)
+        elif discard and conn is self.connection:
+            self.connection = None
+            conn.close()
+
+    def close(self):
+        """Close connection or pool."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.pool is not None:
+            self.pool.close()
 
 
 # Data Source Name regular expression for mysql connection
@@ -148,11 +694,34 @@ re_dsn = re.compile(r"""\w+://            # driver
                               (:(?P<port>[0-9]+))?
                               /(?P<db>\w+)
                               (::(?P<charset>\w+))?
+                              (\?(?P<options>[\w=&\-\.,:]+))?
                            """, re.X)
 
+# replica balance policies
+BALANCES = ("round-robin", "least-loaded")
+
+
+def __init__(self, dsn, bind=False, replicas=(), balance="round-robin",
+             replica_retry=30, ping_interval=30):
+    """__init__ method for Sql object.
+
+    When bind is True, query arguments are passed to driver instead of tosql
+    conversion.
 
-def __init__(self, dsn):
-    """__init__ method for Sql object."""
+    Connection is pinged on transaction start only, when it was idle for
+    ping_interval seconds (0 means always, -1 never). It could be set as
+    Data Source Name option too.
+
+    Read only replicas could be set as replicas keyword argument or
+    Data Source Name option. Replica is host, host:port or dictionary of
+    connection arguments, which update primary connection arguments. Read
+    only transactions (readonly=True) are routed to healthy replica chosen
+    by balance policy (round-robin or least-loaded), others to primary.
+
+    >>> db = Sql("mysql://user@primary/db?replicas=replica1,replica2:3307")
+    >>> db = Sql("mysql://user@primary/db", replicas=["replica1"],
+    ...          balance="least-loaded")
+    """
     match = re_dsn.match(dsn)
     if not match:
         msg = "Bad MySQL Data Source Name `%s`"
@@ -170,6 +739,43 @@ def __init__(self, dsn):
     if passwd:
         self.kwargs["passwd"] = passwd
     self.connection = None
+    self.bind = bind
+
+    options = dict(parse_qsl(match.group("options") or ""))
+    if "replicas" in options and not replicas:
+        replicas = options["replicas"].split(",")
+    balance = options.get("balance", balance)
+    if balance not in BALANCES:
+        raise RuntimeError("Unknown balance policy `%s`" % balance)
+    self.balance = balance
+    retry = float(options.get("replica_retry", replica_retry))
+    self.replicas = [Replica(replica_kwargs(self.kwargs, replica), retry)
+                     for replica in replicas]
+    self.next_replica = count()
+    self.ping_interval = float(options.get("ping_interval", ping_interval))
+
+
+def replica_kwargs(kwargs, replica):
+    """Return connection arguments of replica."""
+    if isinstance(replica, dict):
+        return dict(kwargs, **replica)
+    host, _, port = replica.partition(":")
+    return dict(kwargs, host=host, port=int(port or 3306))
+
+
+def choose_replica(self):
+    """Return healthy replica by balance policy or None."""
+    healthy = [replica for replica in self.replicas if replica.healthy]
+    if not healthy:
+        return None
+    if self.balance == "least-loaded":
+        return min(healthy, key=lambda replica: replica.active)
+    return healthy[next(self.next_replica) % len(healthy)]
+
+
+def new_connection(self):
+    """Create and return new connection for Sql object."""
+    return Connection(**self.kwargs)
 
 
 def connect(self):
@@ -177,23 +783,78 @@ def connect(self):
     if self.connection is not None:
         return self.connection
 
-    self.connection = Connection(**self.kwargs)
+    self.connection = new_connection(self)
     return None
 
 
 def close(self):
     """Close connection."""
-    self.connection.close()
+    if self.connection is not None:
+        self.connection.close()
+        self.connection = None
+    if self.pool is not None:
+        self.pool.close()
+    for replica in getattr(self, "replicas", ()):
+        replica.close()
+
+
+def after_fork(self):
+    """Drop replica connections inherited from parent process."""
+    for replica in self.replicas:
+        self.inherited.append((replica.connection, replica.pool))
+        replica.connection = replica.pool = None
+        replica.active = 0
 
 
-def transaction(self, **kwargs):
-    """Create and return Transaction object as method in Sql object."""
+def transaction(self, readonly=False, **kwargs):
+    """Create and return Transaction object as method in Sql object.
+
+    Read only transaction is created on replica, if some is healthy. Failed
+    replica is marked down and next one is tried; primary is the last.
+    """
+    kwargs.setdefault("bind", self.bind)
+    kwargs.setdefault("ping_interval", self.ping_interval)
+    while readonly:
+        replica = choose_replica(self)
+        if replica is None:
+            break
+        try:
+            return replica.transaction(self, readonly=True, **kwargs)
+        except OperationalError:
+            replica.mark_down()
+
+    if self.pool is not None:
+        conn = self.pool.get()
+        try:
+            return Transaction(conn,
+                               release=partial(pool_release, self.pool),
+                               **kwargs)
+        except Exception:
+            self.pool.discard(conn)
+            raise
     self.connect()
     return Transaction(self.connection, **kwargs)
 
 
+def pool_release(pool, conn, discard=False):
+    """Give back connection to pool, or discard it when it is broken."""
+    if discard:
+        pool.discard(conn)
+    else:
+        pool.put(conn)
+
+
+def is_transient(error):
+    """Return True if transaction could be run again after error."""
+    return isinstance(error, MySQLError) and bool(error.args) \
+        and error.args[0] in TRANSIENT_ERRORS
+
+
 def __str__(self):
-    return "mysql://%s:%s@%s:%d/%s::%s" % \
+    retval = "mysql://%s:%s@%s:%d/%s::%s" % \
         (self.kwargs["user"], self.kwargs.get("passwd", ""),
          self.kwargs["host"], self.kwargs["port"], self.kwargs["db"],
          self.kwargs["charset"])
+    if self.replicas:
+        retval += "?replicas=" + ",".join(map(str, self.replicas))
+    return retval
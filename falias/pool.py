@@ -0,0 +1,153 @@
+"""Thread-safe pool of connections.
+
+Pool is generic, it only needs factory function, which returns new
+connection object with close method. It is used by falias.sql.Sql in pool
+mode, but it could be used for any other connections.
+
+>>> from sqlite3 import connect
+>>> from falias.pool import Pool
+>>> pool = Pool(lambda: connect("/tmp/test.db", check_same_thread=False),
+...             pool_size=2, max_overflow=1)
+>>> conn = pool.get()
+>>> pool.put(conn)
+>>> pool.close()
+"""
+
+import logging
+from queue import Empty, LifoQueue
+from threading import Lock
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class Pool:
+    """Pool of connections with size limits and idle recycling.
+
+    pool_size - count of connections, which are kept open in pool
+    max_overflow - count of connections, which could be opened over
+                   pool_size; they are closed when they are returned
+    timeout - how long (in seconds) get method waits for free connection,
+              before RuntimeError is raised; None means forever
+    recycle - connections which was idle more then recycle seconds are
+              closed and opened again on checkout, other expired idle
+              connections are closed when any connection is returned;
+              -1 disable recycling
+    """
+
+    def __init__(self, factory, pool_size=5, max_overflow=10, timeout=30,
+                 recycle=-1):
+        if pool_size < 1:
+            raise ValueError("pool_size must be greater than 0")
+        self.factory = factory
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+
+        self._idle = LifoQueue()
+        self._lock = Lock()
+        self._size = 0          # count of all opened connections
+
+    @property
+    def size(self):
+        """Count of opened connections (idle and checked out)."""
+        return self._size
+
+    @property
+    def idle(self):
+        """Count of idle connections in pool."""
+        return self._idle.qsize()
+
+    def _create(self):
+        """Create new connection, pool size was incremented yet."""
+        try:
+            return self.factory()
+        except BaseException:
+            with self._lock:
+                self._size -= 1
+            raise
+
+    def _close(self, conn):
+        """Close connection and decrement pool size."""
+        with self._lock:
+            self._size -= 1
+        try:
+            conn.close()
+        except Exception:
+            logger.exception("Pool: closing connection failed")
+
+    def get(self):
+        """Return connection from pool.
+
+        When no idle connection is in pool, new one is created if limits
+        allows it. Otherwise method waits for connection returned by another
+        thread.
+        """
+        try:
+            conn, stamp = self._idle.get(block=False)
+        except Empty:
+            with self._lock:
+                create = self._size < self.pool_size + self.max_overflow
+                if create:
+                    self._size += 1
+            if create:
+                return self._create()
+            try:
+                conn, stamp = self._idle.get(timeout=self.timeout)
+            except Empty:
+                raise RuntimeError("Connection pool timeout") from None
+
+        if self.recycle > -1 and monotonic() - stamp > self.recycle:
+            self._close(conn)
+            with self._lock:
+                self._size += 1
+            return self._create()
+        return conn
+
+    def put(self, conn):
+        """Return connection back to pool.
+
+        Connections over pool_size are closed, and idle connections are
+        swept.
+        """
+        self.sweep()
+        with self._lock:
+            overflow = self._idle.qsize() >= self.pool_size
+        if overflow:
+            self._close(conn)
+        else:
+            self._idle.put((conn, monotonic()))
+
+    def sweep(self):
+        """Close idle connections, which were idle more then recycle."""
+        if self.recycle < 0:
+            return
+        limit = monotonic() - self.recycle
+        with self._idle.mutex:
+            queue = self._idle.queue        # the oldest are at the bottom
+            index = 0
+            while index < len(queue) and queue[index][1] < limit:
+                index += 1
+            expired = queue[:index]
+            del queue[:index]
+        for conn, _ in expired:
+            self._close(conn)
+
+    def discard(self, conn):
+        """Close connection which could not be returned back to pool."""
+        self._close(conn)
+
+    def copy(self):
+        """Return new empty pool with the same factory and limits."""
+        return self.__class__(self.factory, self.pool_size,
+                              self.max_overflow, self.timeout, self.recycle)
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                conn, _ = self._idle.get(block=False)
+            except Empty:
+                break
+            self._close(conn)
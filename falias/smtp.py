@@ -16,10 +16,21 @@ email by Smtp class.
 import logging
 import re
 import socket
+from contextlib import suppress
+from email.header import Header
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from smtplib import SMTP, SMTP_SSL, SMTPException
-from time import localtime, strftime
+from email.policy import SMTP as SMTP_POLICY
+from email.utils import getaddresses
+from heapq import heappop, heappush
+from itertools import count
+from smtplib import (SMTP, SMTP_SSL, SMTPException, SMTPRecipientsRefused,
+                     SMTPServerDisconnected)
+from threading import Condition, Lock, Thread
+from time import localtime, monotonic, strftime
+
+from falias.pool import Pool
+from falias.sql import Sql
 
 # Data Source Name regular expression for smtp server
 re_dsn = re.compile(
@@ -41,9 +52,15 @@ class Smtp:
 
     In fact, class parse Data Source Name for smtp and not do connection at
     initialization process. But send_* methods do that.
+
+    When pool_size is set, authenticated sessions are kept in falias.pool.Pool
+    and reused for next messages. Session is checked by NOOP command before
+    use, and it is closed, when it was idle more than idle_timeout seconds.
+    Idle sessions are swept when any session is returned to pool, so without
+    traffic they stay open until close method is called.
     """
 
-    def __init__(self, dsn):
+    def __init__(self, dsn, pool_size=0, max_overflow=0, idle_timeout=60):
         """Raise RuntimeError when dsn is not valid.
 
         Data Source Name for smtp looks like: smtp://localhost/mcbig@localhost
@@ -64,6 +81,11 @@ class Smtp:
         self.timeout = socket._GLOBAL_DEFAULT_TIMEOUT
         self._class = SMTP_SSL if self.protocol == "smtps" else SMTP
 
+        self.pool = None
+        if pool_size:
+            self.pool = Pool(self.connect, pool_size, max_overflow,
+                             recycle=idle_timeout)
+
     def __str__(self):
         """Return Data Source Name of set values."""
         return "%s://%s%s%s%s:%d/%s::%s" % \
@@ -75,6 +97,16 @@ class Smtp:
     def send_email_txt(self, subject, recipient, body, **kwargs):
         """Send email as text/plain content type.
 
+        Keyword arguments are the same as for create_email_txt method.
+        """
+        msg = self.create_email_txt(subject, recipient, body, **kwargs)
+        logger.info("SMTP: Sub:%s, From:%s, To:%s", msg["Subject"],
+                    msg["From"], msg["To"])
+        self.send_message(msg)
+
+    def create_email_txt(self, subject, recipient, body, **kwargs):
+        """Return email message as text/plain content type.
+
         Keyword arguments:
             - `sender` default sender is set by Data Source Name
             - `reply` Reply-To header
@@ -92,26 +124,26 @@ class Smtp:
             msg["Reply-To"] = kwargs["reply"]
 
         msg["X-Mailer"] = kwargs.get("xmailer", self.xmailer)
-
-        logger.info("SMTP: Sub:%s, From:%s, To:%s", msg["Subject"],
-                    msg["From"], msg["To"])
-
-        try:
-            smtp = self._class(self.host, self.port, timeout=self.timeout)
-
-            if self.user:
-                smtp.login(self.user, self.passwd)
-            smtp.sendmail(msg["From"], msg["To"], msg.as_string())
-        except SMTPException:
-            logger.exception("SMTP: Sending email failed")
-            raise
-        finally:
-            smtp.close()
+        return msg
 
     def send_email_alternative(self, subject, recipient, txt_body, html_body,
                                **kwargs):
         """Send email as text/html with alternative plain/text content.
 
+        Keyword arguments are the same as for create_email_alternative
+        method.
+        """
+        msg = self.create_email_alternative(subject, recipient, txt_body,
+                                            html_body, **kwargs)
+        logger.info("SMTP: Sub:%s, From:%s, To:%s", msg["Subject"],
+                    msg["From"], msg["To"])
+        self.send_message(msg)
+
+    def create_email_alternative(self, subject, recipient, txt_body,
+                                 html_body, **kwargs):
+        """Return email message as text/html with alternative plain/text
+        content.
+
         Keyword arguments:
             - `sender` default sender is set by Data Source Name
             - `reply` Reply-To header
@@ -136,21 +168,409 @@ class Smtp:
 
         msg.attach(part1)
         msg.attach(part2)
+        return msg
 
-        logger.info("SMTP: Sub:%s, From:%s, To:%s", msg["Subject"],
-                    msg["From"], msg["To"])
-
+    def connect(self):
+        """Return new connected SMTP session, logged in if user is set."""
+        smtp = self._class(self.host, self.port, timeout=self.timeout)
         try:
-            smtp = self._class(self.host, self.port, timeout=self.timeout)
-
             if self.user:
                 smtp.login(self.user, self.passwd)
-            smtp.sendmail(msg["From"], msg["To"], msg.as_string())
+        except BaseException:
+            smtp.close()
+            raise
+        return smtp
+
+    def session(self):
+        """Return live SMTP session from pool.
+
+        Session is checked by NOOP command, dead sessions are replaced by new
+        one."""
+        smtp = self.pool.get()
+        try:
+            alive = smtp.noop()[0] == 250
+        except (SMTPException, OSError):
+            alive = False
+        if not alive:
+            self.pool.discard(smtp)
+            smtp = self.pool.get()
+        return smtp
+
+    @staticmethod
+    def envelope(msg):
+        """Return tuple of sender, list of recipients and message data.
+
+        msg could be email.message.Message object or such tuple yet."""
+        if isinstance(msg, tuple):
+            return msg
+        recipients = [addr for _, addr in getaddresses(
+            msg.get_all("To", []) + msg.get_all("Cc", []))]
+        return msg["From"], recipients, msg.as_string()
+
+    def sendmail(self, smtp, msg):
+        """Send message by SMTP session."""
+        return smtp.sendmail(*self.envelope(msg))
+
+    def send_message(self, msg):
+        """Send prepared email.message.Message object.
+
+        Without pool, new SMTP connection is created for each message."""
+        try:
+            if self.pool is None:
+                smtp = self.connect()
+                try:
+                    return self.sendmail(smtp, msg)
+                finally:
+                    smtp.close()
+
+            smtp = self.session()
+            for retry in (True, False):
+                try:
+                    retval = self.sendmail(smtp, msg)
+                except SMTPServerDisconnected:
+                    self.pool.discard(smtp)
+                    if not retry:
+                        raise
+                    smtp = self.pool.get()      # server dropped session
+                    continue
+                except SMTPException:
+                    self.pool.put(smtp)         # session is still usable
+                    raise
+                except BaseException:
+                    self.pool.discard(smtp)
+                    raise
+                self.pool.put(smtp)
+                return retval
         except SMTPException:
-            logger.exception("SMTP: Sendig email failed")
+            logger.exception("SMTP: Sending email failed")
             raise
+
+    def send_many(self, messages, workers=1):
+        """Send all messages and return list of results.
+
+        Messages are sent by workers threads, each worker use its own SMTP
+        session for all of its messages. Sending does not stop on errors.
+        Each result is dictionary with recipient as key, and None if message
+        was accepted for recipient, or error tuple (code, response) or
+        exception instance if not. When message could not be prepared for
+        sending, its result is exception instance.
+
+        messages could be email.message.Message objects or tuples of sender,
+        recipients list and message data.
+        """
+        items = enumerate(messages)
+        lock = Lock()
+        results = {}
+        total = 0
+
+        def work():
+            nonlocal total
+            smtp = None
+            try:
+                while True:
+                    with lock:
+                        try:
+                            index, msg = next(items)
+                        except StopIteration:
+                            return
+                        total += 1
+                    smtp, results[index] = self._send_one(smtp, msg)
+            finally:
+                if smtp is not None:
+                    smtp.close()
+
+        threads = [Thread(target=work) for _ in range(workers - 1)]
+        for thread in threads:
+            thread.start()
+        try:
+            work()                      # current thread is worker too
         finally:
-            smtp.close()
+            for thread in threads:
+                thread.join()
+        return [results.get(i) for i in range(total)]
+
+    def _send_one(self, smtp, msg):
+        """Send one message for send_many, return session and result."""
+        try:
+            sender, recipients, data = self.envelope(msg)
+        except Exception as err:
+            logger.warning("SMTP: Bad message: %s", err)
+            return smtp, err
+        result = dict.fromkeys(recipients)
+        for retry in (True, False):
+            try:
+                if smtp is None:
+                    smtp = self.connect()
+                result.update(smtp.sendmail(sender, recipients, data))
+            except SMTPServerDisconnected as err:
+                smtp = None
+                if retry:
+                    continue            # reconnect and try once again
+                result = dict.fromkeys(recipients, err)
+            except SMTPRecipientsRefused as err:
+                result.update(err.recipients)
+            except SMTPException as err:
+                result = dict.fromkeys(recipients, err)
+            except Exception as err:    # connection or unexpected error
+                if smtp is not None:
+                    with suppress(Exception):
+                        smtp.close()
+                smtp = None
+                result = dict.fromkeys(recipients, err)
+            break
+        for recipient, error in result.items():
+            if error is not None:
+                logger.warning("SMTP: Sending email to %s failed: %s",
+                               recipient, error)
+        return smtp, result
+
+    def create_template(self, subject, txt_body, html_body=None, **kwargs):
+        """Return MailTemplate for repeated sending of the same body.
+
+        Without html_body, message is text/plain, otherwise it is text/html
+        with alternative text/plain content. Keyword arguments are the same
+        as for create_email_txt method.
+        """
+        return MailTemplate(self, subject, txt_body, html_body, **kwargs)
+
+    def send_template(self, template, recipient, **fields):
+        """Send email created from MailTemplate to recipient."""
+        envelope = template.render(recipient, **fields)
+        logger.info("SMTP: Sub:%s, From:%s, To:%s", template.subject,
+                    envelope[0], recipient)
+        self.send_message(envelope)
+
+    def close(self):
+        """Close all idle sessions in pool."""
+        if self.pool is not None:
+            self.pool.close()
+
+
+class MailTemplate:
+    """Precompiled email message for repeated sending.
+
+    Body parts are encoded and serialized only once, and render method only
+    prepends Subject, To and Date headers for each recipient. Subject could
+    contain str.format fields, which are filled by render method. Body is
+    not formatted, use Smtp.create_email_* methods for personalized bodies.
+
+    >>> template = smtp.create_template('Hello {name}', txt, html)
+    >>> smtp.send_template(template, 'joe@domain.xy', name='Joe')
+    >>> smtp.send_many(template.render(it.email, name=it.name)
+    ...                for it in users)
+    """
+
+    def __init__(self, smtp, subject, txt_body, html_body=None, **kwargs):
+        if html_body is None:
+            msg = MIMEText(txt_body)
+            msg.set_charset(smtp.charset)
+        else:
+            msg = MIMEMultipart("alternative")
+            part1 = MIMEText(txt_body, "plain")
+            part1.set_charset(smtp.charset)
+            part2 = MIMEText(html_body, "html")
+            part2.set_charset(smtp.charset)
+            msg.attach(part1)
+            msg.attach(part2)
+
+        msg["From"] = self.sender = kwargs.get("sender", smtp.sender)
+        if "reply" in kwargs:
+            msg["Reply-To"] = kwargs["reply"]
+        msg["X-Mailer"] = kwargs.get("xmailer", smtp.xmailer)
+
+        self.subject = subject
+        self.charset = smtp.charset
+        # headers and body are separated by first empty line
+        self.head, self.body = msg.as_bytes(policy=SMTP_POLICY).split(
+            b"\r\n\r\n", 1)
+        self._subject = self.encode_subject(subject)
+
+    def encode_subject(self, subject):
+        """Return Subject header value encoded and folded for message."""
+        charset = "us-ascii" if subject.isascii() else self.charset
+        return Header(subject, charset, header_name="Subject").encode(
+            linesep="\r\n")
+
+    def render(self, recipient, **fields):
+        """Return tuple of sender, recipients list and message bytes.
+
+        Fields are formatted to subject only, message body is encoded once
+        in constructor and it is the same for all recipients. Result could be
+        passed to Smtp.send_message or Smtp.send_many."""
+        if fields:
+            subject = self.encode_subject(self.subject.format(**fields))
+        else:
+            subject = self._subject
+        head = "Subject: %s\r\nTo: %s\r\nDate: %s\r\n" % (
+            subject, recipient, strftime("%a, %d %b %Y %X %z", localtime()))
+        return (self.sender, [recipient],
+                b"".join((head.encode("utf-8"), self.head, b"\r\n\r\n",
+                          self.body)))
+
+
+# spool table for MailQueue for each sql driver
+SPOOL_TABLE = {
+    "sqlite": """CREATE TABLE IF NOT EXISTS falias_mail_spool (
+                    id INTEGER PRIMARY KEY, sender TEXT, recipients TEXT,
+                    data TEXT, attempts INTEGER)""",
+    "mysql": """CREATE TABLE IF NOT EXISTS falias_mail_spool (
+                    id INTEGER PRIMARY KEY AUTO_INCREMENT, sender TEXT,
+                    recipients TEXT, data MEDIUMTEXT, attempts INTEGER)""",
+}
+
+
+class MailQueue:
+    """Background queue for sending emails by Smtp object.
+
+    Messages are put to in-process queue and sent by worker threads, so
+    caller does not wait for SMTP server. When sending fails on temporary
+    error (including 4xx refusal of all recipients), it is tried again after
+    backoff seconds, which are doubled for each next attempt. Permanent
+    errors are logged and message is dropped.
+
+    When spool is set, messages are stored in falias.sql.Sql database
+    until they are sent, and they are loaded again by constructor. Spool
+    could be Data Source Name or Sql object, which must be usable from more
+    threads (in pool mode).
+
+    >>> queue = MailQueue(smtp, workers=2, spool='sqlite:/var/spool/mail.db')
+    >>> queue.start()
+    >>> queue.put(smtp.create_email_txt('Subject', recipient, 'Mail body'))
+    """
+
+    def __init__(self, smtp, workers=1, spool=None, retries=5, backoff=30):
+        self.smtp = smtp
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        if isinstance(spool, str):
+            spool = Sql(spool, pool_size=1)
+        self.spool = spool
+
+        self._heap = []
+        self._cond = Condition()
+        self._counter = count()
+        self._pending = 0
+        self._threads = []
+        self._stopped = False
+
+        if spool is not None:
+            with spool.transaction() as c:
+                c.execute(SPOOL_TABLE[spool.driver])
+                c.execute("SELECT id, sender, recipients, data, attempts "
+                          "FROM falias_mail_spool")
+                for id_, sender, recipients, data, attempts in c.fetchall():
+                    self._push(0, (id_, (sender, recipients.split("\n"),
+                                         data), attempts))
+
+    def start(self):
+        """Start worker threads."""
+        self._stopped = False
+        for _ in range(self.workers):
+            thread = Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, wait=True):
+        """Stop worker threads after their current messages.
+
+        Unsent messages stay in spool, if it is set."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def join(self, timeout=None):
+        """Wait until all messages are sent or failed.
+
+        Returns False when timeout expires before."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def put(self, msg):
+        """Put message to queue.
+
+        msg could be email.message.Message object or tuple of sender,
+        recipients list and message data."""
+        envelope = Smtp.envelope(msg)
+        id_ = None
+        if self.spool is not None:
+            sender, recipients, data = envelope
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
+            with self.spool.transaction() as c:
+                c.execute("INSERT INTO falias_mail_spool "
+                          "(sender, recipients, data, attempts) "
+                          "VALUES (%s, %s, %s, 0)",
+                          (sender, "\n".join(recipients), data))
+                id_ = c.lastrowid
+        self._push(0, (id_, envelope, 0))
+
+    def _push(self, delay, item):
+        with self._cond:
+            self._pending += 1
+            heappush(self._heap, (monotonic() + delay, next(self._counter),
+                                  item))
+            self._cond.notify()
+
+    def _pop(self):
+        """Return next item which is due, or None when queue is stopped."""
+        with self._cond:
+            while not self._stopped:
+                if self._heap:
+                    delay = self._heap[0][0] - monotonic()
+                    if delay <= 0:
+                        return heappop(self._heap)[2]
+                else:
+                    delay = None
+                self._cond.wait(delay)
+            return None
+
+    def _done(self):
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify_all()
+
+    def _work(self):
+        while True:
+            item = self._pop()
+            if item is None:
+                return
+            try:
+                self._send(*item)
+            except Exception:
+                logger.exception("SMTP: Mail queue failed")
+            finally:
+                self._done()
+
+    def _send(self, id_, envelope, attempts):
+        """Send one message, reschedule it on temporary error."""
+        try:
+            self.smtp.send_message(envelope)
+        except (SMTPException, OSError) as err:
+            if isinstance(err, SMTPRecipientsRefused):
+                # all recipients were refused, 4xx codes are temporary
+                code = max((code for code, _ in err.recipients.values()),
+                           default=0)
+            else:
+                code = getattr(err, "smtp_code", 0)
+            if code < 500 and attempts < self.retries:
+                attempts += 1
+                if id_ is not None:
+                    with self.spool.transaction() as c:
+                        c.execute("UPDATE falias_mail_spool SET attempts = %d "
+                                  "WHERE id = %d", (attempts, id_))
+                self._push(self.backoff * 2 ** (attempts - 1),
+                           (id_, envelope, attempts))
+                return
+            logger.error("SMTP: Message to %s was not sent: %s",
+                         ", ".join(envelope[1]), err)
+        if id_ is not None:
+            with self.spool.transaction() as c:
+                c.execute("DELETE FROM falias_mail_spool WHERE id = %d", id_)
 
 
 # Regular expression for check valid email address
@@ -1,14 +1,127 @@
 """Global sql wrapper for universal using depend on driver."""
 
+from contextlib import suppress
+from functools import partial
 from importlib import import_module
+from os import getpid
+from random import uniform
+from threading import local
+from time import sleep
+from weakref import WeakSet, ref
+
+from falias.cache import QueryCache
+from falias.pool import Pool
+from falias.util import sql_logger
 
 # list of Falias suported sql drivers
 drivers = ("sqlite", "mysql")
 
 
+class Savepoint:
+    """Nested transaction, which is savepoint in parent transaction.
+
+    It has the same interface as driver Transaction. Commit releases
+    savepoint, so its changes are committed with parent transaction.
+    Rollback returns changes back to savepoint.
+    """
+
+    def __init__(self, transaction, name, ctx_cursor=None):
+        self.transaction = transaction
+        self.name = name
+        self.ctx_cursor = ctx_cursor or transaction.ctx_cursor
+        self.readonly = transaction.readonly
+        self.done = False
+        transaction.savepoint(name)
+
+    def __enter__(self):
+        return self.cursor(self.ctx_cursor)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def cursor(self, *args):
+        """Create and return cursor of parent transaction."""
+        return self.transaction.cursor(*args)
+
+    def commit(self):
+        """Release savepoint."""
+        self.done = True
+        self.transaction.release_savepoint(self.name)
+
+    def rollback(self):
+        """Rollback to savepoint."""
+        self.done = True
+        self.transaction.rollback_savepoint(self.name)
+
+    def close(self):
+        """Rollback to savepoint, if it was not done."""
+        if not self.done and not self.transaction.done:
+            self.rollback()
+
+    def __del__(self):
+        """If savepoint was not done, call rollback."""
+        if not self.done and not self.transaction.done:
+            self.rollback()
+
+
+def is_active(transaction):
+    """Return True if transaction or savepoint is not done."""
+    if transaction is None or transaction.done:
+        return False
+    if isinstance(transaction, Savepoint):
+        return not transaction.transaction.done
+    return True
+
+
+class ThreadConnection:
+    """Holder of thread's connection, which closes it when thread exits."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def close(self):
+        """Close connection, if it was not closed yet."""
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            with suppress(Exception):
+                connection.close()
+
+    def __del__(self):
+        self.close()
+
+
 class Sql:
-    """ SQL backend wrapper for drivers """
-    def __init__(self, dsn="", **kwargs):
+    """ SQL backend wrapper for drivers
+
+    When pool_size is set, Sql works in pool mode. Each transaction checks
+    out own connection from pool, and commit or rollback returns it back.
+    Other pool arguments are passed to falias.pool.Pool.
+
+    When per_thread is True, each thread has own connection, which is
+    closed when thread exits. Count of opened connections is in
+    live_connections property. It could not be used with pool_size.
+
+    When cache_size is set, falias.cache.QueryCache is created for cursor's
+    cached method, with cache_ttl as default time to live.
+
+    When instrument (falias.stats.Instrument) is set, its hooks are called
+    for each query, commit and rollback.
+
+    Transactions should be done explicitly. When leak_stack is True, stack
+    where transaction was created is part of ResourceWarning about
+    transaction collected still open. Sql object could be used as context
+    manager, which closes it.
+
+    Sql object remembers process id, so when it is used in child process
+    after fork, it opens new connections and pools, so it could be
+    connected in parent process before fork.
+    """
+    def __init__(self, dsn="", pool_size=0, max_overflow=0, pool_timeout=30,
+                 pool_recycle=-1, cache_size=0, cache_ttl=60, instrument=None,
+                 leak_stack=False, per_thread=False, **kwargs):
         driver = kwargs.get("driver")
         if driver is None:
             driver = dsn[:dsn.find(":")]
@@ -18,22 +131,154 @@ class Sql:
         self.driver = driver
         self.m = import_module(f"falias.{driver}")
 
-        self.connection = None
+        self.pid = getpid()
+        self.per_thread = per_thread
+        self._connection = None
+        self.pool = None
+        self.local = local()        # stack of transactions in thread
+        self.holders = WeakSet()    # ThreadConnection objects
+        self.inherited = []         # connections from parent process
+        if per_thread and pool_size:
+            msg = "per_thread could not be used with pool_size"
+            raise RuntimeError(msg)
+        self.cache = QueryCache(cache_size, cache_ttl) if cache_size else None
+        self.instrument = instrument
+        self.leak_stack = leak_stack
         self.m.__init__(self, dsn, **kwargs)
 
+        if pool_size:
+            self.pool = Pool(partial(self.m.new_connection, self),
+                             pool_size, max_overflow, pool_timeout,
+                             pool_recycle)
+
+    def check_pid(self):
+        """Drop connections inherited from parent process after fork.
+
+        They are not closed, because parent process still uses them, and
+        closing could affect it (e.g. SQLite checkpoints WAL on close). They
+        are kept in inherited list instead, so garbage collector does not
+        close them too."""
+        if self.pid == getpid():
+            return
+        self.pid = getpid()
+        self.inherited.append((self._connection, self.pool, self.local))
+        self._connection = None
+        if self.pool is not None:
+            self.pool = self.pool.copy()
+        self.local = local()
+        self.holders = WeakSet()
+        self.m.after_fork(self)
+
+    @property
+    def connection(self):
+        """Connection of Sql object, or of current thread in per_thread mode.
+        """
+        if not self.per_thread:
+            return self._connection
+        holder = getattr(self.local, "holder", None)
+        return None if holder is None else holder.connection
+
+    @connection.setter
+    def connection(self, connection):
+        if not self.per_thread:
+            self._connection = connection
+        elif connection is None:
+            self.local.holder = None
+        else:
+            self.local.holder = ThreadConnection(connection)
+            self.holders.add(self.local.holder)
+
+    @property
+    def live_connections(self):
+        """Count of opened thread connections in per_thread mode."""
+        return sum(1 for holder in list(self.holders)
+                   if holder.connection is not None)
+
     def connect(self):
+        self.check_pid()
         return self.m.connect(self)
 
     def close(self):
+        """Close connection, pool and all thread connections."""
+        self.check_pid()        # do not close connections of parent
+        for holder in list(self.holders):
+            holder.close()
         return self.m.close(self)
 
-    def transaction(self, logger=None, cursor=None):
-        kwargs = {}
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def transaction(self, logger=None, cursor=None, readonly=False,
+                    **kwargs):
+        """Create and return driver Transaction object.
+
+        Other keyword arguments like bind are passed to driver Transaction.
+        When readonly is True, driver could route transaction to read only
+        connection, e.g. MySQL replica.
+
+        When thread has active transaction from this object, Savepoint on it
+        is returned instead of new transaction, and other arguments except
+        cursor are not used. Only write transaction could not be nested in
+        transaction on read only connection, so new one is created.
+        """
+        self.check_pid()
+        stack = self.local.__dict__.setdefault("stack", [])
+        while stack and not is_active(stack[-1]()):
+            stack.pop()
+        if stack:
+            root = stack[-1]()
+            if isinstance(root, Savepoint):
+                root = root.transaction
+            if readonly or not root.readonly:
+                retval = Savepoint(root, "falias_sp_%d" % len(stack), cursor)
+                stack.append(ref(retval))
+                return retval
+
         if logger:
             kwargs["logger"] = logger
         if cursor:
             kwargs["ctx_cursor"] = cursor
-        return self.m.transaction(self, **kwargs)
+        if self.cache is not None:
+            kwargs.setdefault("cache", self.cache)
+        if self.instrument is not None:
+            kwargs.setdefault("instrument", self.instrument)
+        if self.leak_stack:
+            kwargs.setdefault("leak_stack", True)
+        retval = self.m.transaction(self, readonly=readonly, **kwargs)
+        stack.append(ref(retval))
+        return retval
+
+    def run_in_transaction(self, fn, retries=3, backoff=0.1, **kwargs):
+        """Call fn with transaction cursor, commit and return its result.
+
+        When transaction fails on transient error like deadlock, lock wait
+        timeout, lost connection or locked SQLite database, it is rolled
+        back and run again, after jittered exponential backoff in seconds,
+        up to retries times. So fn must not have other side effects. Lost
+        connection is reconnected on first statement of next attempt. Other
+        keyword arguments are passed to transaction method.
+
+        >>> def add(c):
+        ...     c.execute("UPDATE counter SET value = value + 1")
+        >>> db.run_in_transaction(add, retries=5)
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.transaction(**kwargs) as c:
+                    return fn(c)
+            except Exception as err:
+                if attempt >= retries or not self.m.is_transient(err):
+                    raise
+                delay = backoff * 2 ** attempt * uniform(0.5, 1.5)
+                attempt += 1
+                sql_logger.warning(
+                    "SQL: transient error %s, attempt %d in %.3fs",
+                    err, attempt, delay)
+                sleep(delay)
 
     def __copy__(self):
         return self.m.__copy__(self)
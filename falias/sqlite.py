@@ -17,8 +17,19 @@ ERROR:root:SQL: calling rollback()
 
 import re
 import sqlite3
+import warnings
+from contextlib import suppress
+from functools import partial
+from logging import ERROR
+from time import perf_counter
+from traceback import format_stack
+from urllib.parse import parse_qsl, quote, urlencode
+from weakref import WeakSet
 
-from falias.util import islistable, isnumber
+from falias.cache import read_tables, write_tables
+from falias.pool import Pool
+from falias.util import (Query, RawSql, bind_template, islistable, isnumber,
+                         log_sql, plain_template, row_class, sql_logger)
 
 
 def regexp(pattern, string):
@@ -26,37 +37,136 @@ def regexp(pattern, string):
     return (re.search(pattern, (string if string is not None else "")))
 
 
+def null_tosql(cursor, arg, charset):
+    """Convert None to sql."""
+    return "NULL"
+
+
+def number_tosql(cursor, arg, charset):
+    """Numbers (and bool) are formatted by query template."""
+    return arg
+
+
+def str_tosql(cursor, arg, charset):
+    """Convert string to escaped sql string."""
+    # arg = arg.encode(charset)
+    arg = arg.replace("'", "''")
+    return f"'{arg}'"
+
+
+def raw_tosql(cursor, arg, charset):
+    """RawSql is put into query as is."""
+    return arg
+
+
+def listable_tosql(cursor, arg, charset):
+    """Convert list, tuple or set to sql list."""
+    return "(" + ",".join(str(cursor.tosql(a, charset)) for a in arg) + ")"
+
+
 class Cursor(sqlite3.Cursor):
     """Extended cursor with tosql function, for better query arguments and
-    logging."""
+    logging.
+
+    When bind is True, query template is rewritten to ? placeholders (only
+    once, it is cached), and arguments are bound natively by sqlite3.
+    Queries with formatting placeholders like %.2f or %x are rendered as
+    without bind, so result is the same.
+
+    Converter function for each argument type is looked up only once, and
+    it is cached in converters dictionary. Only built-in types are cached,
+    so dictionary could not grow with dynamically created classes.
+
+    When in_limit is set, listable arguments longer than in_limit are loaded
+    to temporary tables falias_in_<position> and they are replaced by
+    subquery from them. Temporary table is rewritten by next query with big
+    list on the same position.
+
+    When cache (falias.cache.QueryCache) is set, write queries invalidate
+    cached results, and cached method could be used.
+
+    When instrument (falias.stats.Instrument) is set, its hooks are called
+    around each query executed by sqlite3.
+    """
+    converters = {type(None): null_tosql, int: number_tosql,
+                  float: number_tosql, bool: number_tosql, str: str_tosql,
+                  RawSql: raw_tosql, list: listable_tosql,
+                  tuple: listable_tosql, set: listable_tosql}
+    in_limit = 0
+    cache = None
+    instrument = None
+
     def __init__(self, connection):
         sqlite3.Cursor.__init__(self, connection)
         self.transaction = None
         self.logger = None
+        self.bind = False
 
     def __del__(self):
         """Automatics closing cursor on destructor."""
-        sqlite3.Cursor.close(self)
-
-    def tosql(self, arg, charset):
-        """Convert arguments to right sql strings."""
-        if arg is None:                                     # null
-            arg = "NULL"
-        elif isnumber(arg):                                 # float, int
-            pass                                            # num
-        elif isinstance(arg, str):                          # str
-            # arg = arg.encode(charset)
-            arg = arg.replace("'", "''")
-            arg = f"'{arg}'"
-        elif isinstance(arg, bool):                         # bool
-            arg = 1 if arg else 0
-        elif islistable(arg):                               # list, tuple, set
-            arg = "(" + ",".join(self.tosql(a, charset) for a in arg) + ")"
+        with suppress(sqlite3.ProgrammingError):    # closed connection
+            sqlite3.Cursor.close(self)
+
+    def converter(self, cls):
+        """Return and cache converter function for type of argument."""
+        if issubclass(cls, (float, int)):                   # float, int
+            conv = number_tosql
+        elif issubclass(cls, str):                          # str
+            conv = str_tosql
+        elif issubclass(cls, (list, tuple, set)):           # list, tuple, set
+            conv = listable_tosql
         else:                                               #
             msg = "Unsupported type"
             raise TypeError(msg)
+        if cls.__module__ == "builtins":
+            self.converters[cls] = conv
+        return conv
+
+    def tosql(self, arg, charset):
+        """Convert arguments to right sql strings."""
+        conv = self.converters.get(type(arg)) or self.converter(type(arg))
+        return conv(self, arg, charset)
+
+    def prepare(self, query):
+        """Return compiled query template, which could be used for execute.
+
+        Query placeholders are parsed only once, which helps in bind mode."""
+        return Query(query)
+
+    def tobind(self, arg, kind):
+        """Prepare argument for binding like tosql do for %-format."""
+        if kind in "di" and isinstance(arg, float):
+            return int(arg)
+        if kind == "f" and isnumber(arg):
+            return float(arg)
         return arg
 
+    def bind_args(self, query, args):
+        """Return query with ? placeholders and arguments for binding.
+
+        Listable arguments are expanded to (?,?,...) placeholders."""
+        if not isinstance(args, (list, tuple)):
+            args = (args,)
+
+        if not any(islistable(arg) or isinstance(arg, RawSql)
+                   for arg in args):
+            sql, kinds = bind_template(query, "?")
+            return sql, tuple(self.tobind(arg, kind)
+                              for arg, kind in zip(args, kinds))
+
+        template, kinds = bind_template(query, "%s")
+        marks, params = [], []
+        for arg, kind in zip(args, kinds):
+            if isinstance(arg, RawSql):
+                marks.append(arg)
+            elif islistable(arg):
+                marks.append("(" + ",".join("?" * len(arg)) + ")")
+                params.extend(self.tobind(it, kind) for it in arg)
+            else:
+                marks.append("?")
+                params.append(self.tobind(arg, kind))
+        return template % tuple(marks), tuple(params)
+
     def execute(self, query, args=(), charset="utf-8"):
         """Execute query.
 
@@ -70,65 +180,230 @@ class Cursor(sqlite3.Cursor):
         assert isinstance(query, str)
         # query = query.encode(charset)
 
+        if self.cache is not None:
+            self.uncache(query)
+
+        if self.in_limit and isinstance(args, (list, tuple)):
+            args = self.in_tables(args)
+
+        empty = isinstance(args, (list, tuple)) and not args
+        if self.bind and not empty and plain_template(query):
+            sql, params = self.bind_args(query, args)
+            if self.logger is not None:
+                log_sql(self.logger, "SQL: \33[0;32m%s\33[0m %s", sql, params)
+            return self.run(query, sql, args, params)
+
+        sql = self.render(query, args, charset)
+        if self.logger is not None:
+            log_sql(self.logger, "SQL: \33[0;32m%s\33[0m", sql)
+        return self.run(query, sql, args)
+
+    def run(self, query, sql, args, params=(),
+            method=sqlite3.Cursor.execute):
+        """Execute final sql by sqlite3, with instrument hooks if set."""
+        if self.instrument is None:
+            return method(self, sql, params)
+        self.instrument.before_execute(self, query, sql, args, params)
+        start = perf_counter()
+        try:
+            retval = method(self, sql, params)
+        except Exception as err:
+            self.instrument.after_execute(self, query, sql, args, params,
+                                          perf_counter() - start, -1, err)
+            raise
+        self.instrument.after_execute(self, query, sql, args, params,
+                                      perf_counter() - start, self.rowcount,
+                                      None)
+        return retval
+
+    def render(self, query, args=(), charset="utf-8"):
+        """Return query with arguments converted by tosql."""
         if isinstance(args, (list, tuple)):
-            _args = []
-            for arg in args:
-                _args.append(self.tosql(arg, charset))
-            args = tuple(_args)
+            converters = self.converters
+            args = tuple((converters.get(type(arg))
+                          or self.converter(type(arg)))(self, arg, charset)
+                         for arg in args)
         else:
             args = self.tosql(args, charset)
 
         try:
-            sql = query % args if args else query
+            return query % args if args else query
         except Exception:
             if self.logger is not None:
-                self.logger("SQL \33[0;31mquery: %s\33[0m" % query)
-                self.logger("SQL args: %s" % str(args))
+                log_sql(self.logger, "SQL \33[0;31mquery: %s\33[0m", query,
+                        level=ERROR)
+                log_sql(self.logger, "SQL args: %s", args, level=ERROR)
             raise
 
+    def uncache(self, query):
+        """Invalidate cached results of tables, which query writes to."""
+        tables = write_tables(query)
+        if tables is not None:
+            self.cache.invalidate(tables)
+            if self.transaction is not None:
+                self.transaction.written.append(tables)
+
+    def cached(self, query, args=(), ttl=None):
+        """Return all rows of query from cache.
+
+        When result is not in cache, query is executed and fetched rows are
+        stored. Without cache, it is the same as execute and fetchall.
+        Cursor attributes like description are not set from cache.
+
+        After write in the same transaction, query is executed directly,
+        because uncommitted rows must not be visible in other transactions
+        by cache."""
+        if self.cache is None or (self.transaction is not None
+                                  and self.transaction.written):
+            self.execute(query, args)
+            return self.fetchall()
+
+        sql = self.render(query, args)
+        key = (self.__class__, sql)
+        rows = self.cache.get(key)
+        if rows is None:
+            self.execute(sql)
+            rows = self.fetchall()
+            self.cache.put(key, rows, read_tables(sql), ttl)
+        elif self.logger is not None:
+            log_sql(self.logger, "SQL: \33[0;32m%s\33[0m (cached)", sql)
+        return list(rows)
+
+    def in_tables(self, args):
+        """Load listable arguments longer than in_limit to temporary tables.
+
+        Returns arguments, where these lists are replaced by subqueries."""
+        retval = []
+        for i, arg in enumerate(args):
+            if islistable(arg) and len(arg) > self.in_limit:
+                table = "temp.falias_in_%d" % i
+                if self.logger is not None:
+                    log_sql(self.logger,
+                            "SQL: \33[0;32mloading %s values to %s\33[0m",
+                            len(arg), table)
+                conn = self.connection
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS %s (value)"
+                             % table)
+                conn.execute("DELETE FROM %s" % table)
+                conn.executemany("INSERT INTO %s (value) VALUES (?)" % table,
+                                 ((it,) for it in arg))
+                arg = RawSql("(SELECT value FROM %s)" % table)
+            retval.append(arg)
+        return tuple(retval)
+
+    def executemany(self, query, seq_of_args):
+        """Execute query for each arguments in seq_of_args sequence.
+
+        Query template is rewritten to ? placeholders, and all arguments are
+        bound natively by sqlite3 in one batch. Listable arguments are not
+        supported here. Queries with formatting placeholders like %.2f are
+        executed for each arguments by execute method.
+        """
+        if not plain_template(query):
+            for args in seq_of_args:
+                self.execute(query, args)
+            return self
+
+        if self.cache is not None:
+            self.uncache(query)
+        sql, kinds = bind_template(query, "?")
+
+        def params():
+            for args in seq_of_args:
+                if not isinstance(args, (list, tuple)):
+                    args = (args,)
+                if any(islistable(arg) for arg in args):
+                    msg = "Listable arguments are not supported"
+                    raise TypeError(msg)
+                yield tuple(self.tobind(arg, kind)
+                            for arg, kind in zip(args, kinds))
+
         if self.logger is not None:
-            self.logger("SQL: \33[0;32m%s\33[0m" % sql)
-        return sqlite3.Cursor.execute(self, sql)
+            log_sql(self.logger, "SQL: \33[0;32m%s\33[0m (executemany)", sql)
+        return self.run(query, sql, seq_of_args, params(),
+                        sqlite3.Cursor.executemany)
+
+    def chunks(self, size=None):
+        """Generate lists of rows by fetchmany, until result is exhausted."""
+        size = size or self.arraysize
+        while True:
+            rows = self.fetchmany(size)
+            if not rows:
+                return
+            yield rows
 
     def executescript(self, sql_script):
+        if self.cache is not None:
+            self.cache.clear()
         if self.logger is not None:
-            self.logger("SQL: \33[0;32mcalling sql script\33[0m")
+            log_sql(self.logger, "SQL: \33[0;32mcalling sql script\33[0m")
         return sqlite3.Cursor.executescript(self, sql_script)
 
 
 class DictCursor(Cursor):
-    """Implementation of Dictionary cursor for sqlite."""
-    def fetchone(self):
-        """Fetches a single row from the cursor.
+    """Implementation of Dictionary cursor for sqlite.
+
+    Rows are sqlite3.Row objects, created directly by sqlite3 module."""
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.row_factory = sqlite3.Row
 
-        None indicates that no more rows are available."""
-        row = super().fetchone()
-        return sqlite3.Row(self, row) if row else row
 
-    def fetchall(self):
-        """Fetchs all available rows from the cursor."""
-        rows = super().fetchall()
-        return [sqlite3.Row(self, row) for row in rows]
+class RowCursor(Cursor):
+    """Cursor which returns falias.util.Row objects.
+
+    Row class with column names is created only once for each result set."""
+    def execute(self, query, args=(), charset="utf-8"):
+        super().execute(query, args, charset)
+        if self.description:
+            self.row_factory = row_class(
+                tuple(it[0] for it in self.description))
+        else:
+            self.row_factory = None
+        return self
 
-    def fetchmany(self, size=-1):
-        """Fetch up to size rows from the cursor.
 
-        Result set may be smaller than size. If size is not defined,
-        cursor.arraysize is used."""
-        size = size if size > -1 else self.arraysize
-        rows = super().fetchmany(size)
-        return [sqlite3.Row(self, row) for row in rows]
+# sqlite3 cursors read rows on demand, so they are unbuffered yet; aliases
+# are defined for compatibility with falias.mysql
+SSCursor = Cursor
+SSDictCursor = DictCursor
+SSRowCursor = RowCursor
 
 
 class Transaction():
     """Transaction connection class with automatic rollback in destructor."""
 
-    def __init__(self, connection, logger=None, ctx_cursor=Cursor):
-        """logger is log handler with one text parametr."""
+    def __init__(self, connection, logger=None, ctx_cursor=Cursor,
+                 release=None, bind=False, in_limit=0, cache=None,
+                 instrument=None, leak_stack=False, readonly=False):
+        """logger is logging.Logger, falias.sql logger by default, or log
+        handler with one text parametr. Queries are logged as debug messages,
+        which are formatted only if they are emitted.
+
+        release is function, which gets back connection, when transaction
+        is done. It is used by connection pool. bind, in_limit, cache and
+        instrument are set to cursors. Tables written in transaction are
+        invalidated in cache again on commit or rollback.
+
+        Transaction should be done by commit, rollback or close. When it is
+        collected by garbage collector still open, ResourceWarning is
+        emitted, with stack where it was created if leak_stack is True.
+
+        readonly means, that transaction runs on read only connection.
+        """
         self.connection = connection
         self.done = False
-        self.logger = logger
+        self.logger = sql_logger if logger is None else logger
         self.ctx_cursor = ctx_cursor
+        self.release = release
+        self.bind = bind
+        self.in_limit = in_limit
+        self.cache = cache
+        self.written = []
+        self.instrument = instrument
+        self.cursors = WeakSet()
+        self.stack = format_stack()[:-1] if leak_stack else None
+        self.readonly = readonly
 
     def __enter__(self):
         return self.cursor(self.ctx_cursor)
@@ -142,9 +417,15 @@ class Transaction():
     def cursor(self, cursorclass=Cursor):
         """Create and return cursor.
 
-        Cursor could be Cursor (default) or DictCursor."""
+        Cursor could be Cursor (default), DictCursor or RowCursor. SSCursor,
+        SSDictCursor and SSRowCursor are only aliases for them."""
         c = cursorclass(self.connection)
         c.logger = self.logger
+        c.bind = self.bind
+        c.in_limit = self.in_limit
+        c.cache = self.cache
+        c.instrument = self.instrument
+        self.cursors.add(c)
         c.transaction = self
         return c
 
@@ -152,37 +433,172 @@ class Transaction():
         """Commit transaction and log it when logger was set."""
         self.done = True
         if self.logger is not None:
-            self.logger("SQL: \33[3;34mcalling commit()\33[0m")
-        return self.connection.commit()
+            log_sql(self.logger, "SQL: \33[3;34mcalling commit()\33[0m")
+        start = perf_counter()
+        try:
+            retval = self.connection.commit()
+            if self.instrument is not None:
+                self.instrument.after_commit(self, perf_counter() - start)
+        except Exception:
+            # failed transaction must not stay open on released connection
+            with suppress(Exception):
+                self.connection.rollback()
+            raise
+        finally:
+            self._uncache()
+            self._release()
+        return retval
 
     def rollback(self):
         """Rollback transaction and log it when logger was set."""
         self.done = True
         if self.logger is not None:
-            self.logger("SQL: \33[3;33mcalling rollback()\33[0m")
-        return self.connection.rollback()
+            log_sql(self.logger, "SQL: \33[3;33mcalling rollback()\33[0m")
+        start = perf_counter()
+        try:
+            retval = self.connection.rollback()
+            if self.instrument is not None:
+                self.instrument.after_rollback(self, perf_counter() - start)
+        finally:
+            self._uncache()
+            self._release()
+        return retval
+
+    def savepoint(self, name):
+        """Create savepoint for nested transaction.
+
+        Transaction is begun first, otherwise release of savepoint would
+        commit it."""
+        if not self.connection.in_transaction:
+            self.query("BEGIN")
+        self.query("SAVEPOINT %s" % name)
+
+    def release_savepoint(self, name):
+        """Release savepoint, its changes stay in transaction."""
+        self.query("RELEASE SAVEPOINT %s" % name)
+
+    def rollback_savepoint(self, name):
+        """Rollback changes after savepoint and release it."""
+        self.query("ROLLBACK TO SAVEPOINT %s" % name)
+        self.query("RELEASE SAVEPOINT %s" % name)
+
+    def query(self, sql):
+        """Execute transaction control statement."""
+        if self.logger is not None:
+            log_sql(self.logger, "SQL: \33[3;34m%s\33[0m", sql)
+        self.connection.execute(sql)
+
+    def _uncache(self):
+        """Invalidate tables written in transaction."""
+        written, self.written = self.written, []
+        for tables in written:
+            self.cache.invalidate(tables)
+
+    def _release(self):
+        """Give back the connection, if release function was set."""
+        if self.release is not None:
+            release, self.release = self.release, None
+            release(self.connection)
+            self.connection = None
+
+    def close(self):
+        """Close all cursors and rollback transaction, if it was not done."""
+        # set could contain dead references in garbage collector cycle
+        for c in list(self.cursors):
+            c.close()
+        self.cursors.clear()
+        if not self.done and self.connection is not None:
+            self.rollback()
 
     def __del__(self):
-        """If transaction was not done, call rollback."""
+        """If transaction was not done, warn about it and close it."""
         if not self.done:
-            self.rollback()
+            msg = "Transaction was not done"
+            if self.stack:
+                msg += ", it was created at:\n" + "".join(self.stack)
+            warnings.warn(msg, ResourceWarning, source=self)
+            with suppress(sqlite3.ProgrammingError):    # closed connection
+                self.close()
 
 
 # Data Source Name regular expression for sqlite connection
 re_dsn = re.compile(r"""\w+:       # driver
                         ((?P<memory>memory)|/(?P<dbfile>[\w\.\/]+))
                         (::)?(?P<charset>[\w\-]+)?
+                        (:*\?(?P<options>[\w=&\-]+))?
                     """, re.X)
 
-
-def __init__(self, dsn, **kwargs):
-    """__init__ method for Sql object."""
-    if kwargs:
-        self.dbfile = kwargs.get("dbfile")
-        self.memory = kwargs.get("memory")
-        self.charset = kwargs.get("charset", "utf-8")
-
-    else:
+# allowed values of performance pragmas, int means any integer
+PRAGMAS = {
+    "journal_mode": ("delete", "truncate", "persist", "memory", "wal", "off"),
+    "synchronous": ("off", "normal", "full", "extra", "0", "1", "2", "3"),
+    "cache_size": int,
+    "mmap_size": int,
+    "temp_store": ("default", "file", "memory", "0", "1", "2"),
+    "busy_timeout": int,
+}
+
+# predefined sets of pragmas
+PROFILES = {
+    # more processes share one database file
+    "server": {"journal_mode": "wal",
+               "synchronous": "normal",
+               "cache_size": -64000,        # 64 MiB
+               "mmap_size": 268435456,      # 256 MiB
+               "temp_store": "memory",
+               "busy_timeout": 5000},
+}
+
+
+def pragmas(profile=None, **kwargs):
+    """Return checked pragmas from profile, updated by kwargs.
+
+    Unknown profile, pragma or its value raise RuntimeError."""
+    if profile is not None and profile not in PROFILES:
+        raise RuntimeError("Unknown SQLite profile `%s`" % profile)
+    retval = dict(PROFILES.get(profile, {}))
+    for key, val in kwargs.items():
+        if key not in PRAGMAS:
+            raise RuntimeError("Unknown SQLite option `%s`" % key)
+        allowed = PRAGMAS[key]
+        try:
+            val = int(val) if allowed is int else str(val).lower()
+        except ValueError:
+            val = None
+        if val is None or allowed is not int and val not in allowed:
+            raise RuntimeError("Bad value of SQLite option `%s`" % key)
+        retval[key] = val
+    return retval
+
+
+def __init__(self, dsn, bind=False, **kwargs):
+    """__init__ method for Sql object.
+
+    When bind is True, query arguments are bound natively by sqlite3.
+
+    Performance pragmas journal_mode, synchronous, cache_size, mmap_size,
+    temp_store and busy_timeout, or profile with predefined pragmas, could
+    be set as Data Source Name options or keyword arguments:
+
+    >>> db = Sql("sqlite:/var/lib/db.sqlite?profile=server&cache_size=-8000")
+    >>> db = Sql(driver="sqlite", dbfile="db.sqlite", journal_mode="wal")
+
+    When readers option is set, database file is used by count of readers
+    read only connections (mode=ro) for read only transactions, and by one
+    writer connection for others. Writer transactions wait for each other,
+    so writes are serialized. WAL journal mode is default in this mode, so
+    readers do not block writer. Pool mode is not used with readers.
+
+    >>> db = Sql("sqlite:/var/lib/db.sqlite?readers=4")
+    >>> with db.transaction(readonly=True) as c:
+    ...     c.execute("SELECT * FROM config")
+    """
+    self.bind = bind
+    self.reader_pool = self.writer_pool = None
+    options = {key: kwargs.pop(key) for key in ("profile", "readers",
+                                                *PRAGMAS)
+               if key in kwargs}
+    if dsn:
         match = re_dsn.match(dsn)
         if not match:
             msg = "Bad SQLite Data Source Name `%s`"
@@ -190,24 +606,72 @@ def __init__(self, dsn, **kwargs):
         self.dbfile = match.group("dbfile")
         self.memory = match.group("memory")
         self.charset = match.group("charset") or "utf-8"
+        options = dict(parse_qsl(match.group("options") or ""), **options)
 
+    else:
+        self.dbfile = kwargs.get("dbfile")
+        self.memory = kwargs.get("memory")
+        self.charset = kwargs.get("charset", "utf-8")
 
-def connect(self):
-    """Reconect method for Sql object."""
-    if self.connection is not None:
-        return self.connection
-
-    if self.dbfile:
+    self.readers = int(options.pop("readers", 0))
+    self.pragmas = pragmas(**options)
+    if self.readers:
+        if not self.dbfile:
+            msg = "Memory database could not be shared by readers"
+            raise RuntimeError(msg)
+        self.pragmas.setdefault("journal_mode", "wal")
+        self.writer_pool = Pool(partial(new_connection, self), 1, 0, None)
+        self.reader_pool = Pool(partial(new_connection, self, True),
+                                self.readers, 0, None)
+
+
+def new_connection(self, readonly=False):
+    """Create and return new connection for Sql object.
+
+    Read only connection is opened by mode=ro URI."""
+    # connections in pool or per thread are shared between threads
+    check_same_thread = self.pool is None and not self.readers \
+        and not self.per_thread
+    if readonly:
+        if not self.writer_pool.size:
+            # writer creates database file and sets journal mode first
+            self.writer_pool.put(self.writer_pool.get())
+        try:
+            connection = sqlite3.connect(
+                "file:%s?mode=ro" % quote(self.dbfile), uri=True,
+                check_same_thread=False)
+        except sqlite3.OperationalError as e:
+            e.args = (*e.args, self.dbfile)
+            raise
+    elif self.dbfile:
         try:
-            self.connection = sqlite3.connect(self.dbfile)
+            connection = sqlite3.connect(
+                self.dbfile, check_same_thread=check_same_thread)
         except sqlite3.OperationalError as e:
             e.args = (*e.args, self.dbfile)
             raise
     else:
-        self.connection = sqlite3.connect(":memory:")
+        if not check_same_thread:
+            msg = "Memory database could not be shared between threads"
+            raise RuntimeError(msg)
+        connection = sqlite3.connect(":memory:")
 
     # PRAGMA encoding = "UTF-8"; # UTF-8 | UTF-16 | UTF-16le | UTF-16be
-    self.connection.execute("PRAGMA foreign_keys = ON")  # eneble foreign keys
+    connection.execute("PRAGMA foreign_keys = ON")  # eneble foreign keys
+    # busy_timeout first, journal_mode could wait for lock
+    for key in sorted(self.pragmas, key=lambda key: key != "busy_timeout"):
+        if readonly and key == "journal_mode":
+            continue        # it could not be changed by read only connection
+        connection.execute("PRAGMA %s = %s" % (key, self.pragmas[key]))
+    return connection
+
+
+def connect(self):
+    """Reconect method for Sql object."""
+    if self.connection is not None:
+        return self.connection
+
+    self.connection = new_connection(self)
     return None
 # enddef
 
@@ -216,20 +680,65 @@ def close(self):
     """Close connection."""
     if self.connection is not None:
         self.connection.close()
-
-
-def transaction(self, **kwargs):
-    """Create and return Transaction object as method in Sql object."""
+        self.connection = None
+    if self.pool is not None:
+        self.pool.close()
+    if getattr(self, "reader_pool", None) is not None:
+        self.reader_pool.close()
+        self.writer_pool.close()
+
+
+def after_fork(self):
+    """Drop reader and writer pools inherited from parent process."""
+    if self.reader_pool is not None:
+        self.inherited.extend((self.reader_pool, self.writer_pool))
+        self.writer_pool = self.writer_pool.copy()
+        self.reader_pool = self.reader_pool.copy()
+
+
+def transaction(self, readonly=False, **kwargs):
+    """Create and return Transaction object as method in Sql object.
+
+    When readers are set, read only transaction gets reader connection, and
+    others wait for the writer connection. Otherwise readonly is ignored.
+    """
+    kwargs.setdefault("bind", self.bind)
+    kwargs["readonly"] = readonly and self.reader_pool is not None
+    if self.reader_pool is not None:
+        pool = self.reader_pool if readonly else self.writer_pool
+        return Transaction(pool.get(), release=pool.put, **kwargs)
+    if self.pool is not None:
+        return Transaction(self.pool.get(), release=self.pool.put, **kwargs)
     self.connect()
     return Transaction(self.connection, **kwargs)
 
 
+def is_transient(error):
+    """Return True if transaction could be run again after error.
+
+    It is for database or table locked by another connection."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return str(error).startswith(("database is locked",
+                                  "database table is locked"))
+
+
 def __copy__(self):
     """Return copy of object for new thread or new proccess."""
     return self.__class__("", driver=self.driver, dbfile=self.dbfile,
-                          memory=self.memory)
+                          memory=self.memory, bind=self.bind,
+                          readers=self.readers, **self.pragmas)
 
 
 def __str__(self):
     """Return Data Source Name string from Sql object."""
-    return "sqlite:/%s::%s" % (self.dbfile or "memory", self.charset)
+    retval = "sqlite:/%s::%s" % (self.dbfile or "memory", self.charset)
+    options = dict(self.pragmas)
+    if self.readers:
+        options["readers"] = self.readers
+    if options:
+        retval += "?" + urlencode(options)
+    return retval
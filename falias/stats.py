@@ -0,0 +1,112 @@
+"""Query timing, counting and slow query instrumentation.
+
+Instrument object could be set to falias.sql.Sql or to driver Transaction,
+and its hooks are called by cursors and transaction for each query, commit
+and rollback. QueryStats is built-in instrument, which counts queries per
+query template and logs slow queries.
+
+>>> from falias.stats import QueryStats
+>>> stats = QueryStats(slow=0.5)
+>>> db = Sql('sqlite:memory:', instrument=stats)
+>>> ...
+>>> for query, item in stats.stats().items():
+...     print(query, item['count'], item['p99'])
+"""
+
+import logging
+from collections import deque
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class Instrument:
+    """Base instrument class, which hooks do nothing.
+
+    query is query template, sql is query sent to driver, args are query
+    arguments and params are arguments bound by driver (in bind mode).
+    Durations are in seconds. SQLite executes SELECT lazily, so execute
+    duration does not contain time of fetching rows.
+    """
+
+    def before_execute(self, cursor, query, sql, args, params):
+        """Called before query is executed by driver."""
+
+    def after_execute(self, cursor, query, sql, args, params, duration,
+                      rowcount, error):
+        """Called after query is executed, error is exception or None."""
+
+    def after_commit(self, transaction, duration):
+        """Called after transaction commit."""
+
+    def after_rollback(self, transaction, duration):
+        """Called after transaction rollback."""
+
+
+def percentile(values, percent):
+    """Return percentile from sorted list of values."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+class QueryStats(Instrument):
+    """Aggregate statistics per query template and slow query log.
+
+    slow - queries which take more than slow seconds are logged as warning
+    samples - count of last durations per query, which are used for
+              percentiles
+    """
+
+    def __init__(self, slow=None, samples=1000):
+        self.slow = slow
+        self.samples = samples
+        self.commits = 0
+        self.rollbacks = 0
+        self._queries = {}      # query: [count, total, errors, durations]
+        self._lock = Lock()
+
+    def after_execute(self, cursor, query, sql, args, params, duration,
+                      rowcount, error):
+        with self._lock:
+            item = self._queries.get(query)
+            if item is None:
+                item = self._queries[str(query)] = [
+                    0, 0.0, 0, deque(maxlen=self.samples)]
+            item[0] += 1
+            item[1] += duration
+            item[2] += error is not None
+            item[3].append(duration)
+        if self.slow is not None and duration >= self.slow:
+            logger.warning("SQL: slow query %.3fs: %s", duration, sql)
+
+    def after_commit(self, transaction, duration):
+        self.commits += 1
+
+    def after_rollback(self, transaction, duration):
+        self.rollbacks += 1
+
+    def stats(self):
+        """Return dictionary of statistics for each query template.
+
+        Each item is dictionary with count, total, errors, avg, p50, p99 and
+        max keys."""
+        with self._lock:
+            items = [(query, item[0], item[1], item[2], sorted(item[3]))
+                     for query, item in self._queries.items()]
+        return {query: {"count": count,
+                        "total": total,
+                        "errors": errors,
+                        "avg": total / count,
+                        "p50": percentile(durations, 50),
+                        "p99": percentile(durations, 99),
+                        "max": durations[-1] if durations else 0.0}
+                for query, count, total, errors, durations in items}
+
+    def reset(self):
+        """Clear all statistics."""
+        with self._lock:
+            self._queries.clear()
+            self.commits = 0
+            self.rollbacks = 0
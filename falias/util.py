@@ -1,7 +1,17 @@
 """Support library for auto convert or check types."""
 
+import logging
+import re
+from functools import lru_cache
 from json import JSONEncoder
 
+# placeholder in falias query template like %s, %d or %%
+re_placeholder = re.compile(r"%(?:%|([-+ #0]*\d*(?:\.\d+)?[a-zA-Z]))")
+
+# placeholders, which arguments could be bound by driver without change of
+# result
+PLAIN_KINDS = ("s", "d", "i", "f")
+
 
 def nstr(val):
     """Return None or string."""
@@ -27,6 +37,159 @@ def isnumber(obj):
     return isinstance(obj, (float, int))
 
 
+class RawSql(str):
+    """Raw sql text, which is put into query without any conversion."""
+
+
+class Query(str):
+    """Compiled query template.
+
+    Query is str, so it could be used everywhere instead of query template,
+    but rewritten templates for parameter binding are stored in it, so they
+    are not looked up in cache again. It speeds up bind mode only, %-format
+    rendering uses query as is.
+    """
+    def __new__(cls, query):
+        self = super().__new__(cls, query)
+        self.templates = {}
+        return self
+
+
+def bind_template(query, mark):
+    """Return query template rewritten for driver parameter binding.
+
+    All falias placeholders (%s, %d, ...) are replaced by driver mark like
+    ? or %s. Returns tuple of new query and tuple of placeholder
+    specifications like d or .2f, which could be used to convert arguments.
+    Result is cached for each query, or it is stored in Query object.
+    """
+    if isinstance(query, Query):
+        template = query.templates.get(mark)
+        if template is None:
+            template = query.templates[mark] = _bind_template(str(query),
+                                                              mark)
+        return template
+    return _bind_template(query, mark)
+
+
+def plain_template(query):
+    """Return True, if all placeholders are plain like %s, %d or %f.
+
+    Placeholders with flags, width, precision or other conversion types
+    format arguments, so their query must be rendered, not bound."""
+    return all(kind in PLAIN_KINDS for kind in bind_template(query, "%s")[1])
+
+
+@lru_cache(maxsize=512)
+def _bind_template(query, mark):
+    kinds = []
+    percent = "%%" if "%" in mark else "%"
+
+    def replace(match):
+        kind = match.group(1)
+        if kind is None:
+            return percent
+        kinds.append(kind)
+        return mark
+
+    return re_placeholder.sub(replace, query), tuple(kinds)
+
+
+class Row(tuple):
+    """Lightweight row with access by index or by column name.
+
+    It is tuple, so each row is only one object. Column names are shared
+    by all rows from one result set in class created by row_class function.
+    Constructor has the same arguments as sqlite3.Row, so class could be
+    used as row_factory.
+    """
+    __slots__ = ()
+    columns = {}        # column name to index mapping
+
+    def __new__(cls, cursor, row):
+        return tuple.__new__(cls, row)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self.columns[key])
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        try:
+            return tuple.__getitem__(self, self.columns[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def keys(self):
+        """Return list of column names."""
+        return list(self.columns)
+
+    def get(self, key, default=None):
+        """Return value of column or default if column not exists."""
+        index = self.columns.get(key)
+        if index is None:
+            return default
+        return tuple.__getitem__(self, index)
+
+    def asdict(self):
+        """Return dictionary of row."""
+        return dict(zip(self.columns, self))
+
+
+@lru_cache(maxsize=256)
+def row_class(names):
+    """Return Row class for tuple of column names."""
+    columns = {}
+    for i, name in enumerate(names):
+        columns.setdefault(name, i)
+    return type("Row", (Row,), {"__slots__": (), "columns": columns})
+
+
+# max length of values in sql log messages, 0 means unlimited
+LOG_LIMIT = 2000
+
+# default logger for sql queries
+sql_logger = logging.getLogger("falias.sql")
+
+
+class Shorten:
+    """Lazy string of value truncated to limit characters.
+
+    Value is converted to string only when log record is emitted."""
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=LOG_LIMIT):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = str(self.value)
+        if self.limit and len(text) > self.limit:
+            return "%s... (%d chars)" % (text[:self.limit], len(text))
+        return text
+
+
+def log_sql(logger, msg, *args, level=logging.DEBUG):
+    """Log msg with args lazily.
+
+    logger could be logging.Logger, its bound method like log.debug,
+    or any callable with one text parameter. Logger and its bound methods
+    check level first, and message is formatted only when it is emitted.
+    Other callables get formatted message. Arguments are truncated to
+    LOG_LIMIT characters.
+    """
+    owner = getattr(logger, "__self__", None)
+    if isinstance(owner, logging.Logger):
+        method_level = logging.getLevelName(logger.__name__.upper())
+        if isinstance(method_level, int):
+            logger, level = owner, method_level
+    if isinstance(logger, logging.Logger):
+        if logger.isEnabledFor(level):
+            logger.log(level, msg, *(Shorten(arg) for arg in args))
+        return
+    logger(msg % tuple(Shorten(arg) for arg in args) if args else msg)
+
+
 def uniq(lst):
     """Return list without duplicates."""
     return list(set(lst))
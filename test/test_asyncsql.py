@@ -0,0 +1,75 @@
+"""Run test by:
+    $~ py.test tests/test_asyncsql.py
+"""
+
+import asyncio
+from os import path
+from sys import path as python_path
+
+python_path.insert(0, path.abspath(
+                   path.join(path.dirname(__file__), path.pardir)))
+
+from pytest import raises
+
+from falias.asyncsql import AsyncSql
+from falias.sqlite import DictCursor
+
+
+class TestAsyncSql:
+    def test_transaction(self):
+        async def main():
+            db = AsyncSql("sqlite:memory:")
+            async with db.transaction() as c:
+                await c.execute("CREATE TABLE test (value integer)")
+                await c.executemany("INSERT INTO test VALUES (%d)",
+                                    range(3))
+            async with db.transaction(cursor=DictCursor) as c:
+                await c.execute("SELECT sum(value) AS s FROM test")
+                row = await c.fetchone()
+            await db.close()
+            return row["s"]
+
+        assert asyncio.run(main()) == 3
+
+    def test_workers(self, tmp_path):
+        async def select(db, value):
+            async with db.transaction() as c:
+                await c.execute("SELECT %d", (value,))
+                return (await c.fetchone())[0]
+
+        async def main():
+            db = AsyncSql(driver="sqlite",
+                          dbfile=str(tmp_path.joinpath("test.db")),
+                          workers=2)
+            rows = await asyncio.gather(*(select(db, i) for i in range(5)))
+            assert len(db._all) == 2
+            await db.close()
+            return rows
+
+        assert asyncio.run(main()) == list(range(5))
+
+    def test_kwargs(self):
+        async def main():
+            db = AsyncSql("sqlite:memory:")
+            tr = await db.transaction(bind=True, in_limit=10).begin()
+            assert tr.transaction.bind
+            assert tr.transaction.in_limit == 10
+            await tr.rollback()
+            await db.close()
+
+        asyncio.run(main())
+
+    def test_nested(self, tmp_path):
+        async def main():
+            db = AsyncSql(driver="sqlite",
+                          dbfile=str(tmp_path.joinpath("test.db")),
+                          workers=1)
+            async with db.transaction():
+                with raises(RuntimeError):
+                    async with db.transaction():
+                        pass
+            async with db.transaction() as c:     # worker was released
+                await c.execute("SELECT 1")
+            await db.close()
+
+        asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Run test by:
+    $~ py.test tests/test_cache.py
+"""
+
+from os import path
+from sys import path as python_path
+
+python_path.insert(0, path.abspath(
+                   path.join(path.dirname(__file__), path.pardir)))
+
+from falias.cache import QueryCache, read_tables, write_tables
+from falias.sql import Sql
+
+
+class TestParse:
+    def test_read(self):
+        assert read_tables(
+            "SELECT * FROM a x, `db`.`b` AS y LEFT JOIN c ON (x.id = c.id) "
+            "WHERE x.id IN (SELECT id FROM d)") == {"a", "b", "c", "d"}
+        assert write_tables("SELECT 1") is None
+
+    def test_write(self):
+        assert write_tables("INSERT INTO a VALUES (1)") == {"a"}
+        assert write_tables("insert or replace into A values (1)") == {"a"}
+        assert write_tables("UPDATE LOW_PRIORITY b SET x = 1") == {"b"}
+        assert write_tables("DELETE FROM `c` WHERE 1") == {"c"}
+        assert write_tables("CREATE INDEX i ON d (x)") == set()
+
+
+class TestQueryCache:
+    def test_lru(self):
+        cache = QueryCache(size=2)
+        cache.put("one", [1], {"a"})
+        cache.put("two", [2], {"b"})
+        cache.get("one")
+        cache.put("three", [3], {"b"})
+        assert cache.get("two") is None
+        assert cache.get("one") == [1]
+        cache.invalidate({"b"})
+        assert cache.get("three") is None
+        assert cache.get("one") == [1]
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=0)
+        cache.put("one", [1], {"a"})
+        assert cache.get("one") is None
+
+
+class TestSqlCache:
+    def test_cached(self, tmp_path):
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("test.db")),
+                 cache_size=10)
+        with db.transaction() as c:
+            c.execute("CREATE TABLE test (value integer)")
+            c.execute("INSERT INTO test VALUES (%d)", 1)
+        with db.transaction() as c:
+            assert c.cached("SELECT sum(value) FROM test") == [(1,)]
+            assert c.cached("SELECT sum(value) FROM test") == [(1,)]
+        assert db.cache.hits == 1
+        with db.transaction() as c:
+            c.execute("INSERT INTO test VALUES (%d)", 2)
+            assert c.cached("SELECT sum(value) FROM test") == [(3,)]
+            assert len(db.cache) == 0   # uncommitted rows are not cached
+        with db.transaction() as c:
+            assert c.cached("SELECT sum(value) FROM test") == [(3,)]
+        assert db.cache.hits == 1
+
+        tr = db.transaction()
+        c = tr.cursor()
+        c.execute("INSERT INTO test VALUES (%d)", 4)
+        assert c.cached("SELECT sum(value) FROM test") == [(7,)]
+        tr.rollback()
+        with db.transaction() as c:
+            assert c.cached("SELECT sum(value) FROM test") == [(3,)]
@@ -0,0 +1,307 @@
+"""Run test by:
+    $~ py.test tests/test_mysql.py
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from sys import path as python_path
+
+from pytest import fixture, importorskip, raises
+
+python_path.insert(0, path.abspath(
+                   path.join(path.dirname(__file__), path.pardir)))
+
+importorskip("pymysql")
+
+from pymysql import connections
+from pymysql.constants import COMMAND
+from pymysql.err import InterfaceError, OperationalError
+
+from falias import mysql
+from falias.sql import Sql
+from falias.util import RawSql
+
+
+class Result:
+    """Result of executed query."""
+    def __init__(self, affected_rows):
+        self.affected_rows = affected_rows
+        self.warning_count = 0
+        self.description = None
+        self.insert_id = 0
+        self.rows = None
+        self.has_next = False
+        self.unbuffered_active = False
+
+
+class Connection(connections.Connection):
+    """Connection stub, which does not connect to any server.
+
+    Executed queries are stored in queries list. Error codes in errors list
+    are raised by next queries, and connection is closed like by pymysql on
+    lost connection."""
+    failing = set()             # hosts which refuse connections
+
+    def __init__(self, **kwargs):
+        if kwargs["host"] in Connection.failing:
+            raise OperationalError(2003, "Can't connect to MySQL server")
+        self.kwargs = kwargs
+        self.closed = False
+        self.connects = 0
+        self.queries = []
+        self.errors = []
+        options = dict(kwargs)
+        options["database"] = options.pop("db", None)
+        super().__init__(defer_connect=True, **options)
+        self.connect()
+
+    def connect(self, sock=None):
+        self.connects += 1
+        self._sock = True
+        self._closed = False
+        self.server_status = 0
+
+    def _execute_command(self, command, sql):
+        if not self._sock:
+            raise InterfaceError(0, "")
+        if command != COMMAND.COM_QUERY:
+            return
+        if isinstance(sql, bytes):
+            sql = sql.decode(self.encoding)
+        if self.errors:
+            self._sock = None
+            raise OperationalError(self.errors.pop(0), "Lost connection")
+        self.queries.append(sql)
+
+    def _read_ok_packet(self):
+        pass
+
+    def _read_query_result(self, unbuffered=False):
+        query = self.queries[-1]
+        if query.startswith(("INSERT", "REPLACE")):
+            affected_rows = query.count("),(") + 1
+        else:
+            affected_rows = int(query.startswith(("UPDATE", "DELETE")))
+        self._result = Result(affected_rows)
+        return self._result.affected_rows
+
+    def close(self):
+        self.closed = True
+        self._sock = None
+
+
+@fixture
+def connection(monkeypatch):
+    Connection.failing = set()
+    monkeypatch.setattr(mysql, "Connection", Connection)
+    return Connection
+
+
+class TestReplicas:
+    def test_replica_kwargs(self):
+        kwargs = {"host": "primary", "port": 3306, "user": "user"}
+        assert mysql.replica_kwargs(kwargs, "replica") == \
+            {"host": "replica", "port": 3306, "user": "user"}
+        assert mysql.replica_kwargs(kwargs, "replica:3307") == \
+            {"host": "replica", "port": 3307, "user": "user"}
+        assert mysql.replica_kwargs(kwargs, {"host": "replica",
+                                             "user": "reader"}) == \
+            {"host": "replica", "port": 3306, "user": "reader"}
+        assert kwargs["host"] == "primary"
+
+    def test_dsn(self, connection):
+        db = Sql("mysql://user@primary/db?replicas=one,two:3307")
+        assert [str(replica) for replica in db.replicas] == \
+            ["one:3306", "two:3307"]
+        assert str(db).endswith("?replicas=one:3306,two:3307")
+
+    def test_round_robin(self, connection):
+        db = Sql("mysql://user@primary/db", replicas=["one", "two"])
+        hosts = [mysql.choose_replica(db).kwargs["host"] for _ in range(4)]
+        assert hosts == ["one", "two", "one", "two"]
+
+    def test_least_loaded(self, connection):
+        db = Sql("mysql://user@primary/db", replicas=["one", "two"],
+                 balance="least-loaded", pool_size=2)
+        first = db.transaction(readonly=True)
+        with ThreadPoolExecutor(1) as executor:     # other thread
+            second = executor.submit(db.transaction, readonly=True).result()
+        assert first.replica is not second.replica
+        first.commit()
+        assert mysql.choose_replica(db) is first.replica
+        second.commit()
+
+    def test_mark_down(self, connection):
+        db = Sql("mysql://user@primary/db", replicas=["one", "two"])
+        one, two = db.replicas
+        tr = db.transaction(readonly=True)
+        assert tr.replica is one
+        tr.commit()
+        conn = one.connection
+        one.mark_down()
+        assert not one.healthy
+        assert conn.closed
+        assert one.connection is None
+        assert all(mysql.choose_replica(db) is two for _ in range(3))
+        one.mark_up()
+        assert one.healthy
+        assert {mysql.choose_replica(db) for _ in range(2)} == {one, two}
+
+    def test_check(self, connection):
+        db = Sql("mysql://user@primary/db", replicas=["one"])
+        replica = db.replicas[0]
+        connection.failing.add("one")
+        assert not replica.check()
+        assert not replica.healthy
+        connection.failing.clear()
+        assert replica.check()
+        assert replica.healthy
+
+    def test_primary_fallback(self, connection):
+        db = Sql("mysql://user@primary/db", replicas=["one", "two"])
+        connection.failing.update(("one", "two"))
+        tr = db.transaction(readonly=True)
+        assert tr.replica is None
+        assert tr.conn.kwargs["host"] == "primary"
+        assert not any(replica.healthy for replica in db.replicas)
+        tr.commit()
+
+        tr = db.transaction()           # write transaction
+        assert tr.replica is None
+        assert tr.conn is db.connection
+        tr.commit()
+
+
+class TestReconnect:
+    def test_closed_connection(self, connection):
+        db = Sql("mysql://user@primary/db")
+        with db.transaction() as c:
+            c.execute("SELECT 1")
+        conn = db.connection
+        conn._sock = None                   # closed by driver after error
+        with db.transaction() as c:         # used recently, but closed
+            c.execute("SELECT 2")
+        assert conn.connects == 2
+        assert conn.queries[-2:] == ["SELECT 2", "COMMIT"]
+
+    def test_first_statement(self, connection):
+        db = Sql("mysql://user@primary/db")
+        tr = db.transaction()
+        conn = tr.conn
+        conn._sock = None
+        c = tr.cursor()
+        c.execute("SELECT 1")               # InterfaceError(0, "")
+        assert conn.queries == ["SELECT 1"]
+        assert conn.connects == 2
+        tr.commit()
+
+        tr = db.transaction()
+        conn.errors.append(2006)
+        c = tr.cursor()
+        c.execute("SELECT 2")               # lost connection
+        assert conn.queries[-1] == "SELECT 2"
+        assert conn.connects == 3
+        tr.commit()
+
+    def test_lost_connection(self, connection):
+        db = Sql("mysql://user@primary/db", pool_size=1)
+        calls = []
+
+        def update(c):
+            calls.append(c.transaction.conn)
+            c.execute("SELECT 1")
+            if len(calls) == 1:
+                c.connection.errors.append(2013)
+            c.execute("UPDATE test SET value = 1")
+
+        db.run_in_transaction(update, backoff=0)
+        first, second = calls
+        assert first is not second          # broken connection discarded
+        assert first.queries == ["SELECT 1"]
+        assert second.queries == ["SELECT 1", "UPDATE test SET value = 1",
+                                  "COMMIT"]
+        assert db.pool.size == 1
+        assert db.pool.get() is second
+
+    def test_rollback_lost(self, connection):
+        db = Sql("mysql://user@primary/db")
+        tr = db.transaction()
+        c = tr.cursor()
+        c.execute("SELECT 1")
+        tr.conn.errors.append(2013)
+        with raises(OperationalError) as err:
+            with tr:
+                c.execute("SELECT 2")
+        assert err.value.args[0] == 2013
+        with db.transaction() as c:         # reconnected
+            c.execute("SELECT 3")
+
+
+class TestCursor:
+    def test_in_tables_cache(self, connection):
+        db = Sql("mysql://user@primary/db", cache_size=8)
+        with db.transaction(in_limit=2) as c:
+            c.cached("SELECT value FROM test")
+            c.execute("SELECT value FROM test WHERE value IN %s",
+                      ([1, 2, 3],))
+            assert len(db.cache) == 1
+            assert not c.transaction.written
+            assert c.connection.queries[-4:] == [
+                "CREATE TEMPORARY TABLE IF NOT EXISTS falias_in_0_int "
+                "(value BIGINT, KEY (value))",
+                "DELETE FROM falias_in_0_int",
+                "INSERT INTO falias_in_0_int (value) VALUES (1),(2),(3)",
+                "SELECT value FROM test WHERE value IN "
+                "(SELECT value FROM falias_in_0_int)"]
+
+    def test_bind(self, connection):
+        queries = (
+            ("SELECT %d, %s, %s", (1.7, "it's", None)),
+            ("SELECT 1 WHERE 2 IN %s AND 'a' LIKE '%%'", ([1, 2, 3],)),
+            ("SELECT %s", "text"),
+            ("SELECT %s, %d", (RawSql("NOW()"), 2)),
+            ("SELECT %.2f, %5d, '%x'", (3.14159, 42, 255)),
+        )
+        db = Sql("mysql://user@primary/db")
+        bind = Sql("mysql://user@primary/db", bind=True)
+        with db.transaction() as c, bind.transaction() as b:
+            assert b.bind
+            for query, args in queries:
+                c.execute(query, args)
+                b.execute(query, args)
+                assert b.connection.queries[-1] == c.connection.queries[-1]
+            assert c.connection.queries[-1] == "SELECT 3.14,    42, 'ff'"
+            b.execute("SELECT %f", 1)
+            assert b.connection.queries[-1] == "SELECT 1.0e0"
+
+    def test_executemany(self, connection):
+        for bind in (False, True):
+            db = Sql("mysql://user@primary/db", bind=bind)
+            with db.transaction() as c:
+                queries = c.connection.queries
+                c.max_stmt_length = 60
+                assert c.executemany(
+                    "INSERT INTO test (a, b) VALUES (%s, NOW())",
+                    ("x%d" % i for i in range(5))) == 5
+                assert c.rowcount == 5
+                assert queries[-3:] == [
+                    "INSERT INTO test (a, b) VALUES "
+                    "('x0', NOW()),('x1', NOW())",
+                    "INSERT INTO test (a, b) VALUES "
+                    "('x2', NOW()),('x3', NOW())",
+                    "INSERT INTO test (a, b) VALUES ('x4', NOW())"]
+
+                c.max_stmt_length = 1024
+                assert c.executemany(
+                    "INSERT INTO test (a) VALUES (%d) "
+                    "ON DUPLICATE KEY UPDATE a=VALUES(a)", (1, 2.0, 3)) == 3
+                assert queries[-1] == (
+                    "INSERT INTO test (a) VALUES (1),(2),(3) "
+                    "ON DUPLICATE KEY UPDATE a=VALUES(a)")
+
+                assert c.executemany(
+                    "UPDATE test SET a = %d WHERE b = %s",
+                    ((1, "x"), (2, "y"))) == 2
+                assert queries[-2:] == [
+                    "UPDATE test SET a = 1 WHERE b = 'x'",
+                    "UPDATE test SET a = 2 WHERE b = 'y'"]
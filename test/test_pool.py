@@ -0,0 +1,107 @@
+"""Run test by:
+    $~ py.test tests/test_pool.py
+"""
+
+from os import path
+from sys import path as python_path
+from threading import Thread
+from time import sleep
+
+from pytest import raises
+
+python_path.insert(0, path.abspath(
+                   path.join(path.dirname(__file__), path.pardir)))
+
+from falias.pool import Pool
+from falias.sql import Sql
+
+
+class Connection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestPool:
+    def test_reuse(self):
+        pool = Pool(Connection, pool_size=1, max_overflow=0)
+        conn = pool.get()
+        pool.put(conn)
+        assert pool.get() is conn
+
+    def test_overflow(self):
+        pool = Pool(Connection, pool_size=1, max_overflow=1)
+        one, two = pool.get(), pool.get()
+        assert pool.size == 2
+        pool.put(one)
+        pool.put(two)
+        assert two.closed
+        assert pool.size == 1
+        assert pool.idle == 1
+
+    def test_timeout(self):
+        pool = Pool(Connection, pool_size=1, max_overflow=0, timeout=0.01)
+        pool.get()
+        with raises(RuntimeError):
+            pool.get()
+
+    def test_recycle(self):
+        pool = Pool(Connection, pool_size=1, max_overflow=0, recycle=0)
+        conn = pool.get()
+        pool.put(conn)
+        assert pool.get() is not conn
+        assert conn.closed
+        assert pool.size == 1
+
+    def test_sweep(self):
+        pool = Pool(Connection, pool_size=2, max_overflow=0, recycle=0.05)
+        one, two = pool.get(), pool.get()
+        pool.put(one)
+        sleep(0.1)
+        pool.put(two)
+        assert one.closed
+        assert not two.closed
+        assert pool.size == 1
+        assert pool.idle == 1
+
+    def test_copy(self):
+        pool = Pool(Connection, pool_size=2, max_overflow=1, timeout=5)
+        conn = pool.get()
+        pool.put(conn)
+        copy = pool.copy()
+        assert (copy.pool_size, copy.max_overflow, copy.timeout) == (2, 1, 5)
+        assert copy.size == copy.idle == 0
+        assert copy.get() is not conn
+        assert not conn.closed
+
+
+class TestSqlPool:
+    def test_transaction(self, tmp_path):
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("test.db")),
+                 pool_size=2)
+        with db.transaction() as c:
+            c.execute("CREATE TABLE test (value integer)")
+        assert db.pool.idle == 1
+
+        def insert(value):
+            with db.transaction() as c:
+                c.execute("INSERT INTO test (value) VALUES (%d)", (value,))
+
+        threads = [Thread(target=insert, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with db.transaction() as c:
+            c.execute("SELECT count(*) FROM test")
+            assert c.fetchone()[0] == 4
+        assert db.pool.size <= 2
+        db.close()
+
+    def test_memory(self):
+        db = Sql("sqlite:memory:", pool_size=1)
+        with raises(RuntimeError):
+            db.transaction()
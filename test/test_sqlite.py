@@ -9,9 +9,17 @@ from sys import path as python_path
 python_path.insert(0, path.abspath(
                    path.join(path.dirname(__file__), path.pardir)))
 
+import gc
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
 from logging import error
 
-from falias.sql import Sql
+from pytest import mark, raises, warns
+
+from falias.sql import Savepoint, Sql
+from falias.sqlite import DictCursor, RowCursor
 
 
 class TestSqlite():
@@ -32,3 +40,330 @@ class TestSqlite():
         c.execute("INSERT INTO test (value) VALUES (%s)", u"čč")
         c.execute(u"INSERT INTO test (value) VALUES (%s)", "čč")
         c.execute(u"INSERT INTO test (value) VALUES (%s)", u"čč")
+
+    def test_bind(self):
+        queries = (
+            ("SELECT %d, %s, %s", (1.7, "it's", None)),
+            ("SELECT %f, %s", (1, True)),
+            ("SELECT 1 WHERE 2 IN %s AND 'a' LIKE '%%'", ([1, 2, 3],)),
+            ("SELECT %s", "text"),
+            ("SELECT %.2f, %5d", (3.14159, 42)),
+            ("SELECT '%x'", 255),
+        )
+        db = Sql("sqlite:memory:")
+        bind = Sql("sqlite:memory:", bind=True)
+        c = db.transaction().cursor()
+        b = bind.transaction().cursor()
+        assert b.bind
+        for query, args in queries:
+            c.execute(query, args)
+            b.execute(query, args)
+            assert c.fetchall() == b.fetchall()
+
+    def test_executemany(self):
+        db = Sql("sqlite:memory:")
+        tr = db.transaction(logger=error)
+        c = tr.cursor()
+        c.execute("CREATE TABLE test (id integer, value text)")
+        c.executemany("INSERT INTO test (id, value) VALUES (%d, %s)",
+                      ((i, "it's %d" % i) for i in range(100)))
+        assert c.rowcount == 100
+        c.execute("SELECT count(*), max(value) FROM test WHERE id > %d", 49)
+        assert c.fetchone() == (50, "it's 99")
+        c.executemany("INSERT INTO test (id, value) VALUES (%d, %.2f)",
+                      ((100, 3.14159), (101, 2.71828)))
+        c.execute("SELECT value FROM test WHERE id > %d", 99)
+        assert c.fetchall() == [("3.14",), ("2.72",)]
+
+    def test_stream(self):
+        db = Sql("sqlite:memory:")
+        tr = db.transaction()
+        c = tr.cursor()
+        c.execute("CREATE TABLE test (id integer)")
+        c.executemany("INSERT INTO test (id) VALUES (%d)", range(10))
+        c = tr.cursor(DictCursor)
+        c.execute("SELECT id FROM test ORDER BY id")
+        assert [row["id"] for row in c] == list(range(10))
+        c.execute("SELECT id FROM test ORDER BY id")
+        assert [len(rows) for rows in c.chunks(4)] == [4, 4, 2]
+
+    def test_rows(self):
+        db = Sql("sqlite:memory:")
+        tr = db.transaction()
+        c = tr.cursor(RowCursor)
+        c.execute("SELECT 1 AS one, 'two' AS two UNION SELECT 3, 'four'")
+        one, two = c.fetchall()
+        assert one == (1, "two")
+        assert one["two"] == one.two == one[1] == "two"
+        assert two.keys() == ["one", "two"]
+        assert type(one) is type(two)
+        c = tr.cursor(DictCursor)
+        c.execute("SELECT 1 AS one")
+        assert c.fetchone()["one"] == 1
+
+    def test_prepare(self):
+        db = Sql("sqlite:memory:")
+        for bind in (False, True):
+            tr = db.transaction(bind=bind)
+            c = tr.cursor()
+            query = c.prepare("SELECT %d, %s WHERE 'a' LIKE '%%'")
+            for i in range(3):
+                c.execute(query, (IntEnum("Num", "one two")(1), "x%d" % i))
+                assert c.fetchone() == (1, "x%d" % i)
+            tr.rollback()
+
+        c = db.transaction().cursor()
+        with raises(TypeError):
+            c.execute("SELECT %s", object())
+
+    def test_converters(self):
+        db = Sql("sqlite:memory:")
+        c = db.transaction().cursor()
+        converters = dict(c.converters)
+        for i in range(3):
+            c.execute("SELECT %d", IntEnum("Num%d" % i, "one two")(1))
+            assert c.fetchone() == (1,)
+        assert c.converters == converters
+
+    def test_in_limit(self):
+        db = Sql("sqlite:memory:")
+        ids = list(range(0, 2000, 2))
+        for bind in (False, True):
+            tr = db.transaction(bind=bind, in_limit=100)
+            c = tr.cursor()
+            c.execute("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL "
+                      "SELECT x + 1 FROM n WHERE x < 100) "
+                      "SELECT count(*) FROM n WHERE x IN %s AND x < %d",
+                      (ids, 50))
+            assert c.fetchone()[0] == 24
+            c.execute("SELECT count(*) FROM temp.falias_in_0")
+            assert c.fetchone()[0] == 1000
+            tr.rollback()
+
+    def test_pragmas(self, tmp_path):
+        db = Sql("sqlite:memory:?profile=server&cache_size=-2000")
+        assert db.pragmas["synchronous"] == "normal"
+        assert db.pragmas["cache_size"] == -2000
+        c = db.transaction().cursor()
+        c.execute("PRAGMA cache_size")
+        assert c.fetchone() == (-2000,)
+        c.execute("PRAGMA busy_timeout")
+        assert c.fetchone() == (5000,)
+
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("db")),
+                 journal_mode="WAL")
+        c = db.transaction().cursor()
+        c.execute("PRAGMA journal_mode")
+        assert c.fetchone() == ("wal",)
+        assert db.copy().pragmas == {"journal_mode": "wal"}
+
+        with raises(RuntimeError):
+            Sql("sqlite:memory:", synchronous="fast")
+        with raises(RuntimeError):
+            Sql("sqlite:memory:?profile=desktop")
+
+    def test_readers(self, tmp_path):
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("db")),
+                 readers=2)
+        with db.transaction() as c:
+            c.execute("CREATE TABLE test (id integer)")
+            c.execute("INSERT INTO test VALUES (%d)", (1,))
+        first = db.transaction(readonly=True)
+        with ThreadPoolExecutor(1) as executor:     # other thread
+            second = executor.submit(db.transaction, readonly=True).result()
+        assert first.connection is not second.connection
+        c = first.cursor()
+        c.execute("SELECT id FROM test")
+        assert c.fetchall() == [(1,)]
+        c.execute("PRAGMA journal_mode")
+        assert c.fetchone() == ("wal",)
+        with raises(Exception):
+            c.execute("INSERT INTO test VALUES (%d)", (2,))
+        first.rollback()
+        second.commit()
+        assert first.connection is None     # returned to pool
+        first.close()
+        assert db.reader_pool.size == 2
+        assert db.writer_pool.size == 1
+        db.close()
+
+        with raises(RuntimeError):
+            Sql("sqlite:memory:?readers=2")
+
+    def test_run_in_transaction(self, tmp_path):
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("db")),
+                 busy_timeout=0)
+        with db.transaction() as c:
+            c.execute("CREATE TABLE test (id integer)")
+        db.close()
+
+        locker = sqlite3.connect(str(tmp_path.joinpath("db")))
+        locker.execute("BEGIN IMMEDIATE")
+        attempts = []
+
+        def insert(c):
+            attempts.append(c)
+            if len(attempts) == 2:
+                locker.rollback()
+            c.execute("INSERT INTO test VALUES (%d)", (len(attempts),))
+            return len(attempts)
+
+        assert db.run_in_transaction(insert, retries=3, backoff=0) == 2
+        with db.transaction() as c:
+            c.execute("SELECT id FROM test")
+            assert c.fetchall() == [(2,)]
+
+        def error(c):
+            attempts.append(c)
+            c.execute("SELECT * FROM missing")
+
+        attempts.clear()
+        with raises(sqlite3.OperationalError):
+            db.run_in_transaction(error, retries=3, backoff=0)
+        assert len(attempts) == 1
+        locker.close()
+
+    def test_savepoint(self):
+        db = Sql("sqlite:memory:")
+        with db.transaction() as c:
+            c.execute("CREATE TABLE test (id integer)")
+        with db.transaction() as c:
+            c.execute("SELECT 1")       # sqlite does not begin transaction
+            savepoint = db.transaction()
+            assert isinstance(savepoint, Savepoint)
+            with savepoint as n:
+                n.execute("INSERT INTO test VALUES (%d)", (1,))
+            with raises(ValueError):
+                with db.transaction() as n:
+                    n.execute("INSERT INTO test VALUES (%d)", (2,))
+                    raise ValueError()
+            assert c.transaction.connection.in_transaction
+            c.execute("SELECT id FROM test")
+            assert c.fetchall() == [(1,)]
+            c.transaction.rollback()
+        tr = db.transaction()
+        assert not isinstance(tr, Savepoint)
+        c = tr.cursor()
+        c.execute("SELECT id FROM test")
+        assert c.fetchall() == []
+
+    def test_savepoint_readonly(self, tmp_path):
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("db")),
+                 readers=1)
+        with db.transaction() as c:
+            c.execute("CREATE TABLE test (id integer)")
+        with db.transaction(readonly=True) as r:
+            write = db.transaction()        # not in read only connection
+            assert not isinstance(write, Savepoint)
+            with write as w:
+                w.execute("INSERT INTO test VALUES (%d)", (1,))
+                read = db.transaction(readonly=True)
+                assert isinstance(read, Savepoint)
+                assert read.transaction is write
+                read.commit()
+            r.execute("SELECT id FROM test")
+            assert r.fetchall() == [(1,)]
+        db.close()
+
+    def test_close(self):
+        with Sql("sqlite:memory:", leak_stack=True) as db:
+            tr = db.transaction()
+            c = tr.cursor()
+            c.execute("CREATE TABLE test (id integer)")
+            c.execute("INSERT INTO test VALUES (%d)", (1,))
+            tr.close()
+            assert tr.done
+            with raises(sqlite3.ProgrammingError):
+                c.execute("SELECT 1")
+            tr.close()
+
+            tr = db.transaction()
+            tr.cursor().execute("INSERT INTO test VALUES (%d)", (2,))
+            with warns(ResourceWarning, match="created at"):
+                del tr
+                gc.collect()
+            c = db.transaction().cursor()
+            c.execute("SELECT count(*) FROM test")
+            assert c.fetchone() == (0,)
+            c.transaction.close()
+
+    def test_close_cycle(self, tmp_path):
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("db")),
+                 pool_size=1, pool_timeout=0.1)
+        c = db.transaction().cursor()
+        c.handler = c       # cursor and its transaction in cycle
+        c.execute("SELECT 1")
+        with warns(ResourceWarning):
+            del c
+            gc.collect()
+        with db.transaction() as c:     # connection was returned
+            c.execute("SELECT 1")
+        db.close()
+
+    @mark.skipif(not hasattr(os, "fork"), reason="fork is not supported")
+    def test_fork(self, tmp_path):
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("db")))
+        db.connect()
+        with db.transaction() as c:
+            c.execute("CREATE TABLE test (pid integer)")
+        parent = db.connection
+
+        pid = os.fork()
+        if pid == 0:        # child
+            code = 1
+            try:
+                with db.transaction() as c:
+                    c.execute("INSERT INTO test VALUES (%d)", (os.getpid(),))
+                if db.connection is not parent and db.pid == os.getpid() \
+                        and db.inherited[0][0] is parent:
+                    code = 0
+            finally:
+                os._exit(code)
+        assert os.waitpid(pid, 0)[1] == 0
+        assert db.connection is parent and not db.inherited
+        with db.transaction() as c:
+            c.execute("SELECT pid FROM test")
+            assert c.fetchall() == [(pid,)]
+
+        pid = os.fork()
+        if pid == 0:        # child closes only its own connections
+            code = 1
+            try:
+                db.close()
+                parent.execute("SELECT 1")      # it is still open
+                code = 0
+            finally:
+                os._exit(code)
+        assert os.waitpid(pid, 0)[1] == 0
+        parent.execute("SELECT 1")
+
+    def test_per_thread(self, tmp_path):
+        db = Sql(driver="sqlite", dbfile=str(tmp_path.joinpath("db")),
+                 per_thread=True)
+        with db.transaction() as c:
+            c.execute("CREATE TABLE test (id integer)")
+        main = db.connection
+        assert db.live_connections == 1
+
+        def insert(i):
+            with db.transaction() as c:
+                c.execute("INSERT INTO test VALUES (%d)", (i,))
+            with db.transaction():
+                pass
+            return db.connection
+
+        with ThreadPoolExecutor(2) as executor:
+            connections = set(executor.map(insert, range(10)))
+        gc.collect()
+        assert main not in connections
+        assert len(connections) <= 2
+        assert db.live_connections == 1     # worker threads exited
+        with db.transaction() as c:
+            c.execute("SELECT count(*) FROM test")
+            assert c.fetchone() == (10,)
+        assert db.connection is main
+        db.close()
+        assert db.live_connections == 0
+
+        with raises(RuntimeError):
+            Sql(driver="sqlite", dbfile="db", per_thread=True, pool_size=2)
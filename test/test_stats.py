@@ -0,0 +1,65 @@
+"""Run test by:
+    $~ py.test tests/test_stats.py
+"""
+
+from os import path
+from sys import path as python_path
+
+python_path.insert(0, path.abspath(
+                   path.join(path.dirname(__file__), path.pardir)))
+
+from pytest import raises
+
+from falias.sql import Sql
+from falias.stats import Instrument, QueryStats, percentile
+
+
+class Recorder(Instrument):
+    def __init__(self):
+        self.calls = []
+
+    def before_execute(self, cursor, query, sql, args, params):
+        self.calls.append(("before", query, sql))
+
+    def after_execute(self, cursor, query, sql, args, params, duration,
+                      rowcount, error):
+        self.calls.append(("after", query, sql, error is not None))
+
+    def after_commit(self, transaction, duration):
+        self.calls.append(("commit",))
+
+
+def test_percentile():
+    assert percentile([], 50) == 0.0
+    assert percentile([1, 2, 3, 4], 50) == 3
+    assert percentile([1, 2, 3, 4], 99) == 4
+
+
+def test_hooks():
+    recorder = Recorder()
+    db = Sql("sqlite:memory:", instrument=recorder)
+    with db.transaction() as c:
+        c.execute("SELECT %d", (1,))
+    assert recorder.calls == [("before", "SELECT %d", "SELECT 1"),
+                              ("after", "SELECT %d", "SELECT 1", False),
+                              ("commit",)]
+
+
+def test_query_stats(caplog):
+    stats = QueryStats(slow=0)
+    db = Sql("sqlite:memory:", instrument=stats, bind=True)
+    with db.transaction() as c:
+        c.execute("CREATE TABLE t (id integer)")
+        c.executemany("INSERT INTO t VALUES (%d)", [(1,), (2,)])
+        for i in range(3):
+            c.execute("SELECT * FROM t WHERE id = %d", (i,))
+        with raises(Exception):
+            c.execute("SELECT * FROM missing WHERE id = %d", (1,))
+    items = stats.stats()
+    assert items["SELECT * FROM t WHERE id = %d"]["count"] == 3
+    assert items["INSERT INTO t VALUES (%d)"]["count"] == 1
+    assert items["SELECT * FROM missing WHERE id = %d"]["errors"] == 1
+    assert stats.commits == 1
+    assert "slow query" in caplog.text
+    stats.reset()
+    assert stats.stats() == {}
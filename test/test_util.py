@@ -0,0 +1,59 @@
+"""Run test by:
+    $~ py.test tests/test_util.py
+"""
+
+from os import path
+from sys import path as python_path
+
+python_path.insert(0, path.abspath(
+                   path.join(path.dirname(__file__), path.pardir)))
+
+import logging
+
+from falias.util import Shorten, bind_template, log_sql, plain_template
+
+
+class TestBindTemplate:
+    def test_qmark(self):
+        query, kinds = bind_template(
+            "SELECT * FROM t WHERE a = %d AND b LIKE '%%x' AND c = %s", "?")
+        assert query == "SELECT * FROM t WHERE a = ? AND b LIKE '%x' AND c = ?"
+        assert kinds == ("d", "s")
+
+    def test_format(self):
+        query, kinds = bind_template("SELECT %.2f, '%%', %5d", "%s")
+        assert query == "SELECT %s, '%%', %s"
+        assert kinds == (".2f", "5d")
+        assert not plain_template("SELECT %.2f, '%%', %5d")
+        assert plain_template("SELECT %f, '%%', %d, %s")
+
+
+class Value:
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "x" * 10
+
+
+class TestLogSql:
+    def test_shorten(self):
+        assert str(Shorten("abc", 5)) == "abc"
+        assert str(Shorten("abcdefgh", 5)) == "abcde... (8 chars)"
+
+    def test_lazy(self, caplog):
+        log = logging.getLogger("falias.test")
+        value = Value()
+        with caplog.at_level(logging.INFO, "falias.test"):
+            log_sql(log, "SQL: %s", value)
+            log_sql(log.debug, "SQL: %s", value)
+            assert value.calls == 0
+            log_sql(log.info, "SQL: %s", value)
+        assert caplog.messages == ["SQL: xxxxxxxxxx"]
+
+    def test_callable(self):
+        messages = []
+        log_sql(messages.append, "SQL: %s %s", "a", 1)
+        log_sql(messages.append, "SQL: 100%")
+        assert messages == ["SQL: a 1", "SQL: 100%"]